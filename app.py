@@ -1,30 +1,32 @@
 import streamlit as st
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from datetime import datetime
+from datetime import datetime, timedelta
+from pathlib import Path
 import pandas as pd
 import plotly.graph_objects as go
 # Importar funciones de procesamiento
 from src.processing import (
     preparar_dataframes,
-    aplicar_transformaciones,
-    procesar_picking,
-    procesar_chequeo,
-    unir_datos,
-    create_grouped_report
-    
+    cargar_historial,
+    cargar_rango,
+    codificar_categorias
 )
+from src.pipeline import grafo_reporte, ejecutar_pipeline, medir_etapa, reporte_memoria, PERFIL_MEMORIA
+from src.config import cargar_configuracion
+from src.exportacion import tablas_exportacion, exportar_formatos, exportar_lote
+from src.volumen import serie_por_hora
+from src.fechas import parsear_fechas
 
 # Importar funciones de visualización
 from src.visualization import (
-    create_nivel_carga_summary,
-    create_descuento_summary,
     format_dataframe,
     sort_dataframe,
     highlight_cells,
     export_to_excel,
     get_formatted_date,
-    reorder_columns
+    reorder_columns,
+    paginar
 )
 # Configuración de autenticación de Google Drive
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
@@ -124,6 +126,87 @@ def mostrar_configuracion():
     if st.button("Guardar Configuración"):
         st.success("Configuración guardada correctamente")
 
+# Dimensiones disponibles para desglosar el volumen por hora
+DIMENSIONES_VOLUMEN = {
+    "Empresa": "Empresa",
+    "Nivel de carga": "Nivel de carga",
+    "Operador": "id usuario",
+}
+
+def mostrar_volumen():
+    """Seguimiento de volumen: cajas por hora del día seleccionado, por empresa, nivel de carga u operador."""
+    try:
+        st.title("Seguimiento de Volumen Diario")
+
+        df_picking, df_chequeo = preparar_dataframes()
+        if df_picking is None or df_chequeo is None:
+            return
+        df_picking, df_chequeo = codificar_categorias(df_picking, df_chequeo)
+
+        # El volumen comparte con el reporte la transformación del picking y se guarda por día
+        configuracion = cargar_configuracion()
+        resultados = ejecutar_pipeline(
+            grafo_reporte(configuracion['backend']),
+            {'picking': df_picking, 'chequeo': df_chequeo},
+            {'backend': configuracion['backend'], 'incremental': False, 'modo_horas': configuracion['modo_horas']},
+            ['volumen']
+        )
+        volumen = resultados['volumen']
+        if volumen is None or volumen.empty:
+            st.info("No hay registros de picking con horas válidas")
+            return
+
+        # Selección del día (fecha de entrega) y filtros
+        fechas = pd.Series(volumen['Fecha Entrega'].unique())
+        fechas = fechas.iloc[parsear_fechas(fechas).argsort()].tolist()
+        col1, col2, col3, col4 = st.columns(4)
+        fecha = col1.selectbox("Fecha de entrega", fechas, index=len(fechas) - 1)
+        dimension = col2.radio("Desglose", list(DIMENSIONES_VOLUMEN), horizontal=True)
+        volumen = volumen[volumen['Fecha Entrega'] == fecha]
+        empresas = col3.multiselect("Empresa", volumen['Empresa'].dropna().unique().tolist())
+        niveles = col4.multiselect("Nivel de carga", volumen['Nivel de carga'].dropna().unique().tolist())
+        if empresas:
+            volumen = volumen[volumen['Empresa'].isin(empresas)]
+        if niveles:
+            volumen = volumen[volumen['Nivel de carga'].isin(niveles)]
+        if volumen.empty:
+            st.info("No hay volumen para los filtros seleccionados")
+            return
+
+        por_hora = serie_por_hora(volumen, DIMENSIONES_VOLUMEN[dimension])
+        total_hora = por_hora.sum(axis=1)
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total Cajas", f"{volumen['Cajas'].sum():,.0f}")
+        col2.metric("Hora Peak", f"{total_hora.idxmax():%H:%M} ({total_hora.max():,.0f} cajas)")
+        col3.metric("Operadores", f"{volumen['id usuario'].nunique():,}")
+
+        # Cajas por hora apiladas según el desglose
+        fig_volumen = go.Figure([go.Bar(x=por_hora.index, y=por_hora[col], name=str(col)) for col in por_hora.columns])
+        fig_volumen.update_layout(barmode='stack', height=400, margin=dict(t=30, b=30, l=30, r=30),
+                                  xaxis_title="Hora", yaxis_title="Cajas")
+        st.plotly_chart(fig_volumen, use_container_width=True)
+
+        # Mapa de calor de operadores por hora
+        st.markdown("### Cajas por Operador y Hora")
+        por_operador = serie_por_hora(volumen, 'id usuario')
+        por_operador = por_operador[por_operador.sum().sort_values().index]
+        fig_operadores = go.Figure(go.Heatmap(
+            x=por_operador.index, y=por_operador.columns.astype(str), z=por_operador.T.to_numpy(),
+            colorscale='Blues', colorbar={'title': 'Cajas'}
+        ))
+        fig_operadores.update_layout(height=max(300, 20 * len(por_operador.columns) + 80),
+                                     margin=dict(t=30, b=30, l=30, r=30))
+        st.plotly_chart(fig_operadores, use_container_width=True)
+
+        with st.expander("Detalle por hora"):
+            tabla = por_operador.T.iloc[::-1]
+            tabla.columns = tabla.columns.strftime('%d/%m %H:%M')
+            st.dataframe(tabla.style.format("{:,.0f}"), use_container_width=True)
+    except Exception as e:
+        st.error(f"Error en el seguimiento de volumen: {str(e)}")
+        st.exception(e)
+
 # Modificación para recuperar nivel de carga LPN en app.py - Función run_visualization
 
 # Modificación para recuperar nivel de carga LPN en app.py - Función run_visualization
@@ -132,31 +215,71 @@ def run_visualization():
     """Visualización principal con gráficos Gauge y métricas."""
     try:
         st.title('Rendimiento de Producción')
-        df_picking, df_chequeo = preparar_dataframes()
 
-        if df_picking is not None and df_chequeo is not None:
-            df_picking_completo = df_picking.copy()
+        # Selección del periodo: último export o rango de fechas desde el historial de Drive
+        periodo = st.radio("Periodo", ["Último reporte", "Rango de fechas"], horizontal=True)
+        rango = None
+        if periodo == "Rango de fechas":
+            hoy = datetime.now().date()
+            rango = st.date_input("Fechas de entrega", value=(hoy - timedelta(days=6), hoy))
+            if len(rango) != 2:
+                st.info("Seleccione la fecha final del rango")
+                return
+            desde_drive = st.checkbox("Leer desde Google Drive", value=False,
+                                      help="Por defecto se usa el historial local y solo se traen de Drive los días que le faltan")
+            df_picking, df_chequeo = None, None
+            if not desde_drive:
+                df_picking, df_chequeo = cargar_rango(rango[0], rango[1])
+            if df_picking is None:
+                df_picking, df_chequeo = cargar_historial(rango[0], rango[1])
+            if df_picking is not None and df_picking.empty:
+                st.warning("No hay registros de picking en el rango seleccionado")
+                return
+        else:
+            df_picking, df_chequeo = preparar_dataframes()
 
-            # Procesar datos
-            df_picking, df_chequeo = aplicar_transformaciones(df_picking, df_chequeo)
-            df_valid = procesar_picking(df_picking)
-            pallet_grouped = procesar_chequeo(df_chequeo)
-            df_final = unir_datos(df_valid, pallet_grouped)
-            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, df_total_general = create_grouped_report(df_final)
+        if df_picking is not None and df_chequeo is not None:
+            # Codificar columnas de baja cardinalidad con categorías compartidas
+            df_picking, df_chequeo = codificar_categorias(df_picking, df_chequeo)
+            df_picking_completo = df_picking
 
-            # Obtener fecha y KPIs
-            fecha_reporte = df_picking['Fecha Entrega'].iloc[0]
-            rendimiento_actual = df_final['Rendimiento'].mean()
-            error = df_total_general['% Error'].iloc[0] / 100  # Convertir a decimal
-            total_cajas = df_final['CAJAS'].sum()
+            # Procesar datos con el backend configurado (pandas o polars); el último reporte
+            # se puede actualizar de forma incremental a medida que crece el export del día.
+            # Cada etapa se reutiliza mientras sus datos y parámetros no cambien
+            configuracion = cargar_configuracion()
+            incremental = rango is None and configuracion['incremental']
+            parametros = {
+                'backend': configuracion['backend'],
+                'incremental': incremental,
+                'modo_horas': configuracion['modo_horas'],
+                'meta_rendimiento': configuracion['meta_rendimiento'],
+                'meta_error': configuracion['meta_error'],
+            }
+            # Con CONTROL_GESTION_PERFIL_MEMORIA=1 se mide tiempo y memoria de cada etapa
+            perfil = [] if PERFIL_MEMORIA else None
+            resultados = ejecutar_pipeline(
+                grafo_reporte(parametros['backend'], incremental),
+                {'picking': df_picking, 'chequeo': df_chequeo},
+                parametros,
+                ['picking_transformado', 'chequeo_transformado', 'final', 'reporte', 'indicadores', 'nivel_carga', 'descuentos',
+                 'rechazos', 'por_pallet'],
+                perfil=perfil
+            )
+            df_picking = resultados['picking_transformado']
+            df_chequeo = resultados['chequeo_transformado']
+            df_final = resultados['final']
+            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, df_total_general = resultados['reporte']
+            rendimiento_actual, error, total_cajas, color_rendimiento, color_error = resultados['indicadores']
 
-            # Definir metas
-            meta_rendimiento = 310
-            meta_error = 0.0005  # 0.05% en decimal
+            # Obtener fecha del reporte
+            if rango is not None:
+                fecha_reporte = f"{rango[0]:%d/%m/%Y} - {rango[1]:%d/%m/%Y}"
+            else:
+                fecha_reporte = df_picking['Fecha Entrega'].iloc[0]
 
-            # Configurar colores dinámicos
-            color_rendimiento = "red" if rendimiento_actual < meta_rendimiento else "green"
-            color_error = "green" if error < meta_error else "red"
+            # Metas
+            meta_rendimiento = parametros['meta_rendimiento']
+            meta_error = parametros['meta_error']  # 0.05% en decimal
 
             # Gráfico Gauge para Rendimiento
             # Gráfico Gauge para Rendimiento mejorado
@@ -274,9 +397,13 @@ def run_visualization():
             # 1. Reporte Detallado en la columna 1
             with col1:
                 st.markdown("### Reporte Detallado")
-                df_final_report = reorder_columns(df_final_report)
-                df_final_report = format_dataframe(df_final_report)
-                df_final_report = sort_dataframe(df_final_report)
+                with medir_etapa('formato_reporte', perfil):
+                    tipo_fila = df_final_report['Tipo Fila'].values
+                    df_final_report = reorder_columns(df_final_report)
+                    df_final_report = format_dataframe(df_final_report)
+                    df_final_report['Tipo Fila'] = tipo_fila
+                    df_final_report = sort_dataframe(df_final_report)
+                    tipo_fila = df_final_report.pop('Tipo Fila').values
                
                 # AGREGAR ESTAS LÍNEAS AQUÍ
                 # Forzar que Rendimiento sea entero antes de aplicar estilos
@@ -284,12 +411,20 @@ def run_visualization():
                 if 'Rendimiento' in df_final_report.columns:
                     # Primero reemplazar NaN con 0, luego convertir a entero
                     df_final_report['Rendimiento'] = df_final_report['Rendimiento'].fillna(0).astype(float).round(0).astype(int)
-                    styled_df = highlight_cells(df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento)
+                    
+                    # Los estilos se aplican solo a la página visible
+                    filas_por_pagina = cargar_configuracion()['filas_por_pagina']
+                    paginas = max(1, -(-len(df_final_report) // filas_por_pagina))
+                    pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1) if paginas > 1 else 1
+                    df_pagina = paginar(df_final_report, filas_por_pagina, pagina)
+                    tipo_fila_pagina = paginar(pd.Series(tipo_fila), filas_por_pagina, pagina).values
+                    styled_df = highlight_cells(df_pagina, min_rendimiento, mediana_rendimiento, max_rendimiento,
+                                                tipo_fila=tipo_fila_pagina)
                     
                     # Calcular altura automáticamente basada en el número de filas
                     row_height = 35  # altura aproximada por fila en píxeles
                     padding = 40     # espacio para encabezados
-                    table_height = min(500, len(df_final_report) * row_height + padding)
+                    table_height = min(500, len(df_pagina) * row_height + padding)
                     
                     st.dataframe(styled_df, use_container_width=True, height=table_height, hide_index=True)
 
@@ -297,7 +432,7 @@ def run_visualization():
             with col2:
                 # Nivel de Carga
                 st.markdown("### Nivel de Carga")
-                nivel_carga = create_nivel_carga_summary(df_picking_completo)
+                nivel_carga = resultados['nivel_carga']
                 if not nivel_carga.empty:
                     # Calcular altura para nivel de carga
                     nivel_rows = len(nivel_carga)
@@ -306,7 +441,7 @@ def run_visualization():
                 
                 # Detalle de Descuentos
                 st.markdown("### Detalle de Descuentos")
-                descuento_summary = create_descuento_summary(df_chequeo)
+                descuento_summary = resultados['descuentos']
                 if not descuento_summary.empty:
                     # Crear un diccionario de formato que solo aplique a columnas numéricas
                     format_dict = {}
@@ -325,15 +460,67 @@ def run_visualization():
                 else:
                     st.info("No hay datos de descuentos disponibles.")
 
+            # Grupos excluidos del rendimiento por las reglas de anomalías (config/procesamiento.json)
+            rechazos = resultados['rechazos']
+            if rechazos is not None and not rechazos.empty:
+                with st.expander(f"Grupos excluidos del rendimiento: {len(rechazos):,} ({rechazos['Cajas'].sum():,.0f} cajas)"):
+                    resumen_rechazos = rechazos.groupby('Motivo', observed=True).agg(
+                        Grupos=('Cajas', 'size'), Cajas=('Cajas', 'sum')).reset_index()
+                    st.dataframe(resumen_rechazos.style.format({'Grupos': "{:,.0f}", 'Cajas': "{:,.0f}"}), hide_index=True)
+                    st.dataframe(paginar(rechazos, configuracion['filas_por_pagina'], 1), use_container_width=True, hide_index=True)
+                    st.download_button(label="📥 Descargar grupos excluidos (CSV)",
+                                       data=rechazos.to_csv(index=False).encode('utf-8'),
+                                       file_name="grupos_excluidos.csv", mime="text/csv")
+
+            # Descuentos de cada carga (y pallet) atribuidos al usuario chequeado; lo sin usuario se reparte según las cajas
+            por_pallet = resultados['por_pallet']
+            if por_pallet is not None and not por_pallet.empty:
+                with st.expander("Descuentos por carga"):
+                    con_descuento = por_pallet[por_pallet['Total_Descuento'] > 0]
+                    con_descuento = con_descuento.sort_values(['Total_Descuento', 'Descuento Atribuido'], ascending=False)
+                    st.dataframe(paginar(con_descuento, configuracion['filas_por_pagina'], 1),
+                                 use_container_width=True, hide_index=True)
+
             # 5. Botón de descarga
             st.markdown("---")
             col1, col2, col3 = st.columns([1,2,1])
             with col2:
-                reporte_principal = df_final_report.copy()
-                excel_file = export_to_excel(df_picking_completo, df_chequeo, reporte_principal, nivel_carga, descuento_summary)
+                if rango is not None:
+                    nombre_base = f"Picking {rango[0]:%d-%m-%Y} a {rango[1]:%d-%m-%Y}"
+                else:
+                    nombre_base = f"Picking {get_formatted_date(fecha_reporte)}"
+                reporte_principal = df_final_report
+                with medir_etapa('exportacion_excel', perfil):
+                    excel_file = export_to_excel(df_picking_completo, df_chequeo, reporte_principal, nivel_carga, descuento_summary,
+                                                 tipo_fila=tipo_fila)
                 if excel_file:
-                    filename = f"Picking {get_formatted_date(fecha_reporte)}.xlsx"
-                    st.download_button(label="📥 Descargar Reporte Excel", data=excel_file, file_name=filename, mime="application/vnd.ms-excel")
+                    st.download_button(label="📥 Descargar Reporte Excel", data=excel_file, file_name=f"{nombre_base}.xlsx", mime="application/vnd.ms-excel")
+                
+                # Formatos para procesos automáticos (BI, remuneraciones), generados desde las mismas tablas
+                try:
+                    tablas = tablas_exportacion(reporte_principal, nivel_carga, descuento_summary,
+                                                df_picking_completo, df_chequeo, tipo_fila=tipo_fila, rechazos=rechazos,
+                                                por_pallet=por_pallet)
+                    with medir_etapa('exportacion_formatos', perfil):
+                        paquetes = exportar_formatos(tablas)
+                    columnas_descarga = st.columns(len(paquetes))
+                    for columna, (formato, contenido) in zip(columnas_descarga, paquetes.items()):
+                        columna.download_button(label=f"📦 {formato}", data=contenido,
+                                                file_name=f"{nombre_base} ({formato}).zip", mime="application/zip")
+                    
+                    directorio = cargar_configuracion()['directorio_exportacion']
+                    if directorio:
+                        escritos = exportar_lote(tablas, Path(directorio) / nombre_base)
+                        if escritos:
+                            print(f"Exportación por lotes: {len(escritos)} archivos en {Path(directorio) / nombre_base}")
+                except Exception as e:
+                    st.error(f"Error al exportar los formatos de datos: {str(e)}")
+                    print(f"Error detallado al exportar los formatos de datos: {str(e)}")
+
+            # Medición de memoria por etapa (solo las etapas calculadas en esta ejecución)
+            if perfil is not None:
+                with st.expander("Memoria por etapa"):
+                    st.dataframe(reporte_memoria(perfil), hide_index=True)
     except Exception as e:
         st.error(f"Error en la visualización: {str(e)}")
         st.exception(e)
@@ -374,9 +561,7 @@ def run_app():
             run_visualization()  # Llamamos a nuestra propia implementación
             
         elif st.session_state.pagina == "Seguimiento de Volumen":
-            # Aquí deberíamos implementar la función de seguimiento de volumen
-            st.title("Seguimiento de Volumen Diario")
-            st.info("Esta función está en desarrollo")
+            mostrar_volumen()
             
         elif st.session_state.pagina == "Configuración":
             mostrar_configuracion()
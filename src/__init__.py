@@ -0,0 +1,4 @@
+from .config import activar_copy_on_write
+
+# Todo el paquete asume la semántica de copy-on-write de pandas
+activar_copy_on_write()
@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from .reglas import PK_IMAGEN, ORDER_EMPRESAS, COLUMNAS_EMPRESA, REGLAS_EMPRESA, REGLAS_ANOMALIAS, compilar_reglas, condiciones_anomalias
+from .processing import CLAVES_PICKING, COLUMNAS_RECHAZOS, MOTIVO_SIN_HORAS
+from .fechas import detectar_formato, parsear_fechas
+
+def _a_lazy(df, columnas_hora=()):
+    """Convierte un DataFrame de pandas a un LazyFrame con las categorías como texto.
+    Se agrega la posición de cada fila para devolver los resultados sin copiar todo el DataFrame.
+    """
+    df_pl = pl.from_pandas(df).with_columns(pl.col(pl.Categorical).cast(pl.Utf8))
+    df_pl = _parsear_horas(df_pl, df, columnas_hora)
+    return df_pl.lazy().with_row_index('_fila')
+
+def _parsear_horas(df_pl, df, columnas):
+    """Convierte las columnas de hora en Polars con el formato detectado por src.fechas.
+    Las filas que no calzan con ese formato se convierten con parsear_fechas, igual que en pandas.
+    """
+    for col in columnas:
+        if df_pl.schema[col] == pl.Datetime('ns'):
+            continue
+        texto = df_pl[col]
+        formato = detectar_formato(texto.drop_nulls().unique(maintain_order=True).head(50).to_list()) if texto.dtype == pl.Utf8 else None
+        if formato is None:
+            convertidos = pl.Series(col, parsear_fechas(df[col]).to_numpy())
+        else:
+            convertidos = texto.str.strip_chars().str.to_datetime(formato, strict=False, time_unit='ns')
+            fallidos = (convertidos.is_null() & texto.is_not_null()).to_numpy()
+            if fallidos.any():
+                valores = convertidos.to_numpy().copy()
+                valores[fallidos] = parsear_fechas(df[col][fallidos]).to_numpy()
+                convertidos = pl.Series(col, valores)
+        df_pl = df_pl.with_columns(convertidos.alias(col))
+    return df_pl
+
+def _filas_a_pandas(df, resultado, col_empresa):
+    """Selecciona en pandas las filas que conservó Polars y les asigna la empresa reasignada."""
+    df = df.iloc[resultado['_fila'].to_numpy()]
+    df[col_empresa] = pd.Series(resultado[col_empresa].to_numpy(), index=df.index).astype(df[col_empresa].dtype)
+    return df
+
+def _restaurar_tipos(df, tipos):
+    """Restaura en un DataFrame de pandas los tipos categóricos originales."""
+    for col, tipo in tipos.items():
+        if col in df.columns:
+            df[col] = df[col].astype(tipo)
+    return df
+
+def _transformar(lf, tipo, columnas):
+    """Reasigna las empresas con la tabla de reglas y filtra las empresas del reporte.
+    Las reglas se compilan a una sola expresión when/then: la primera que calza define la empresa.
+    """
+    col_empresa = COLUMNAS_EMPRESA[tipo]
+    compiladas = compilar_reglas(REGLAS_EMPRESA, tipo, columnas)
+    if compiladas:
+        expresion = pl
+        for destino, origen, condiciones in compiladas:
+            mascara = pl.lit(True)
+            if origen is not None:
+                mascara = mascara & pl.col(col_empresa).eq_missing(origen)
+            for col, valores in condiciones.items():
+                mascara = mascara & pl.col(col).is_in(list(valores)).fill_null(False)
+            expresion = expresion.when(mascara).then(pl.lit(destino))
+        lf = lf.with_columns(expresion.otherwise(pl.col(col_empresa)).alias(col_empresa))
+    return lf.filter(pl.col(col_empresa).is_in(ORDER_EMPRESAS).fill_null(False))
+
+def _horas_activas(others):
+    """Plan equivalente a horas_activas: une los intervalos de cada grupo ordenados por inicio
+    y suma la duración de los bloques resultantes.
+    """
+    inicio = pl.col('Hora Inicio')
+    termino = pl.col('Hora Termino')
+    return (
+        others.filter(inicio.is_not_null() & termino.is_not_null() & (termino >= inicio))
+        .sort(CLAVES_PICKING + ['Hora Inicio'])
+        .with_columns(termino.cum_max().shift(1).over(CLAVES_PICKING).alias('_termino_previo'))
+        .with_columns(
+            (pl.col('_termino_previo').is_null() | (inicio > pl.col('_termino_previo'))).cum_sum().alias('_bloque')
+        )
+        .group_by(CLAVES_PICKING + ['_bloque'])
+        .agg((termino.max() - inicio.min()).dt.total_nanoseconds().alias('_duracion'))
+        .group_by(CLAVES_PICKING)
+        .agg((pl.col('_duracion').sum() / 3.6e12).alias('Horas_Activas'))
+    )
+
+def _procesar_picking(lf, modo_horas='rango'):
+    """Plan equivalente a procesar_picking, sin el redondeo final del rendimiento.
+    Retorna (plan de grupos válidos e IMAGEN, plan de grupos rechazados con su Motivo).
+    """
+    no_lpn = pl.col('Nivel de carga').ne_missing('LPN')
+    es_imagen = pl.col('id usuario').is_in(list(PK_IMAGEN)).fill_null(False)
+    claves_validas = pl.all_horizontal([pl.col(col).is_not_null() for col in CLAVES_PICKING])
+
+    # Usuarios de PK_IMAGEN: solo se acumulan cajas
+    cajas_imagen = (
+        lf.filter(no_lpn & es_imagen & claves_validas)
+        .group_by(CLAVES_PICKING)
+        .agg(pl.col('Cajas').sum())
+        .sort(CLAVES_PICKING)
+    )
+
+    # Resto de usuarios: corregir términos del día siguiente y agrupar
+    un_dia = pl.duration(days=1)
+    termino = pl.col('Hora Termino')
+    others = (
+        lf.filter(no_lpn & ~es_imagen & claves_validas)
+        .with_columns(
+            pl.when(termino < pl.col('Hora Inicio')).then(termino + un_dia).otherwise(termino).alias('Hora Termino')
+        )
+    )
+    cajas_others = (
+        others
+        .group_by(CLAVES_PICKING)
+        .agg(
+            pl.col('Cajas').sum(),
+            pl.col('Hora Inicio').min().alias('Hora_Inicio_Min'),
+            pl.col('Hora Termino').max().alias('Hora_Termino_Max')
+        )
+        .sort(CLAVES_PICKING)
+    )
+
+    inicio_min = pl.col('Hora_Inicio_Min')
+    termino_max = pl.col('Hora_Termino_Max')
+    condiciones = condiciones_anomalias(REGLAS_ANOMALIAS, pl.col, pl.lit)
+    if modo_horas == 'activo':
+        cajas_others = cajas_others.join(_horas_activas(others), on=CLAVES_PICKING, how='left', maintain_order='left')
+        horas = pl.col('Horas_Activas').fill_null(0)
+    else:
+        horas = (termino_max - inicio_min).dt.total_nanoseconds() / 1e9 / 3600
+
+    # Motivo de rechazo: el primero que aplica, como en evaluar_anomalias
+    motivo = pl.when(inicio_min.is_null() | termino_max.is_null()).then(pl.lit(MOTIVO_SIN_HORAS))
+    for nombre, condicion in condiciones:
+        motivo = motivo.when(~condicion.fill_null(False)).then(pl.lit(nombre))
+    grupos = (
+        cajas_others
+        .with_columns(pl.when(termino_max < inicio_min).then(termino_max + un_dia).otherwise(termino_max).alias('Hora_Termino_Max'))
+        .with_columns(horas.alias('Horas Picking'))
+        .with_columns((pl.col('Cajas') / pl.col('Horas Picking')).alias('Rendimiento'))
+        .with_columns(motivo.otherwise(pl.lit(None, dtype=pl.Utf8)).alias('Motivo'))
+    )
+    valid_others = grupos.filter(pl.col('Motivo').is_null()).drop('Motivo')
+    rechazados = grupos.filter(pl.col('Motivo').is_not_null()).select(COLUMNAS_RECHAZOS)
+
+    return pl.concat([valid_others, cajas_imagen], how='diagonal_relaxed'), rechazados
+
+def _procesar_chequeo(lf, columnas):
+    """Plan equivalente a procesar_chequeo, sin el cálculo final del % de error."""
+    if 'Cantidad de unidades' not in columnas:
+        lf = lf.with_columns((pl.col('Cantidad') if 'Cantidad' in columnas else pl.lit(0)).alias('Cantidad de unidades'))
+    if 'discqty' not in columnas:
+        lf = lf.with_columns((pl.col('Descuento') if 'Descuento' in columnas else pl.lit(0)).alias('discqty'))
+
+    return (
+        lf.filter(pl.col('id usuario').is_not_null() & pl.col('empresa').is_not_null())
+        .group_by(['id usuario', 'empresa'])
+        .agg(
+            pl.col('Cantidad de unidades').sum().alias('Total_Unidades'),
+            pl.col('discqty').sum().alias('Total_Descuento')
+        )
+    )
+
+def _unir_datos(valid, pallet_grouped):
+    """Plan equivalente a unir_datos: join interno que conserva el orden del picking."""
+    return (
+        valid.with_row_index('_orden')
+        .join(pallet_grouped, left_on=['id usuario', 'Empresa'], right_on=['id usuario', 'empresa'], how='inner')
+        .sort('_orden')
+        .rename({'id usuario': 'USUARIO', 'Total_Descuento': 'Cjs c/ Error', 'Cajas': 'CAJAS'})
+        .select(['Fecha Entrega', 'USUARIO', 'Empresa', 'Descripcion', 'CAJAS', 'Rendimiento', 'Total_Unidades', 'Cjs c/ Error'])
+    )
+
+def _rechazos_a_pandas(rechazados, tipos):
+    """Convierte los grupos rechazados a pandas con los mismos tipos y redondeo que calcular_rendimiento."""
+    df = _restaurar_tipos(rechazados.to_pandas(), tipos)
+    df['Rendimiento'] = df['Rendimiento'].replace([np.inf, -np.inf], np.nan).round(2)
+    motivos = [MOTIVO_SIN_HORAS] + [regla['motivo'] for regla in REGLAS_ANOMALIAS]
+    df['Motivo'] = df['Motivo'].astype(pd.CategoricalDtype(list(dict.fromkeys(motivos))))
+    return df
+
+def procesar_polars(df_picking, df_chequeo, modo_horas='rango', devolver_rechazos=False):
+    """Ejecuta transformaciones, picking, chequeo y unión como un único plan lazy de Polars.
+    Retorna (df_picking, df_chequeo, df_final) en pandas, igual que el backend pandas;
+    con devolver_rechazos=True agrega los grupos rechazados por las reglas de anomalías.
+    """
+    tipos_picking = {col: df_picking[col].dtype for col in df_picking.columns
+                     if isinstance(df_picking[col].dtype, pd.CategoricalDtype)}
+
+    picking = _transformar(_a_lazy(df_picking, ['Hora Inicio', 'Hora Termino']), 'picking', df_picking.columns)
+    chequeo = _transformar(_a_lazy(df_chequeo), 'chequeo', df_chequeo.columns)
+    valid, rechazados = _procesar_picking(picking, modo_horas)
+    final = _unir_datos(valid, _procesar_chequeo(chequeo, df_chequeo.columns))
+
+    # Un solo collect para todos los resultados: el plan común se ejecuta una vez
+    picking_pl, chequeo_pl, final_pl, *rechazados_pl = pl.collect_all([
+        picking.select(['_fila', 'Empresa']),
+        chequeo.select(['_fila', 'empresa']),
+        final
+    ] + ([rechazados] if devolver_rechazos else []))
+
+    df_final = final_pl.to_pandas()
+
+    # Cálculos finales por fila, con el mismo redondeo de pandas
+    df_final['Rendimiento'] = df_final['Rendimiento'].round(2)
+    df_final['% Error'] = (df_final['Cjs c/ Error'] / df_final['Total_Unidades']) * 100
+    df_final['% Error'] = df_final['% Error'].fillna(0).replace([np.inf, -np.inf], 0).round(2)
+    df_final['Cjs c/ Error'] = df_final['Cjs c/ Error'].round(0).astype(int)
+    df_final = df_final.drop(columns=['Total_Unidades'])
+
+    tipos_final = {('USUARIO' if col == 'id usuario' else col): tipo for col, tipo in tipos_picking.items()}
+
+    resultado = (
+        _filas_a_pandas(df_picking, picking_pl, 'Empresa'),
+        _filas_a_pandas(df_chequeo, chequeo_pl, 'empresa'),
+        _restaurar_tipos(df_final, tipos_final)
+    )
+    if devolver_rechazos:
+        return resultado + (_rechazos_a_pandas(rechazados_pl[0], tipos_picking),)
+    return resultado
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Directorio del caché persistente (se puede cambiar con la variable de entorno)
+CACHE_DIR = Path(os.environ.get(
+    'CONTROL_GESTION_CACHE_DIR',
+    Path.home() / '.cache' / 'control-de-gestion'
+))
+
+# Resultados en memoria (por ejemplo, el Excel del reporte)
+MAX_MEMO = 8
+
+def _nombre_archivo(texto):
+    """Deja solo caracteres válidos para un nombre de archivo."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(texto))
+
+def clave_revision(archivo):
+    """Genera la clave de caché de la revisión de un archivo de Drive."""
+    return _nombre_archivo(archivo.get('md5Checksum') or archivo.get('modifiedTime') or 'sin-revision')
+
+def ruta_cache(archivo, variante=None):
+    """Retorna la ruta del archivo Parquet asociado a una revisión de Drive.
+    Las revisiones de un mismo archivo quedan en un directorio por id, para poder eliminar las anteriores.
+    La variante distingue lecturas distintas de una misma revisión (por ejemplo, el esquema usado).
+    """
+    nombre = clave_revision(archivo) if not variante else f"{clave_revision(archivo)}-{variante}"
+    return CACHE_DIR / 'drive' / _nombre_archivo(archivo['id']) / f"{nombre}.parquet"
+
+def eliminar_revisiones_anteriores(archivo):
+    """Elimina del caché las revisiones de un archivo de Drive distintas de la actual (todas sus variantes).
+    Los exports diarios se reescriben con el mismo id: sin esto el caché crecería con cada revisión.
+    """
+    revision = clave_revision(archivo)
+    directorio = CACHE_DIR / 'drive' / _nombre_archivo(archivo['id'])
+    # Archivos con el formato anterior (todas las revisiones en un solo directorio)
+    anteriores = list((CACHE_DIR / 'drive').glob(f"{_nombre_archivo(archivo['id'])}-*.parquet"))
+    anteriores += [ruta for ruta in directorio.glob('*.parquet')
+                   if ruta.stem != revision and not ruta.stem.startswith(f"{revision}-")]
+    for ruta in anteriores:
+        try:
+            ruta.unlink()
+        except OSError as e:
+            print(f"No se pudo eliminar el caché {ruta}: {str(e)}")
+    return len(anteriores)
+
+def normalizar_tipos(df):
+    """Convierte a texto las columnas object con tipos mezclados para poder guardarlas en Parquet."""
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            valores = df[col].dropna()
+            if valores.map(type).nunique() > 1:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def leer_cache(archivo, variante=None):
+    """Lee el DataFrame cacheado de una revisión de Drive, o retorna None si no existe."""
+    ruta = ruta_cache(archivo, variante)
+    if not ruta.exists():
+        return None
+    try:
+        return pd.read_parquet(ruta)
+    except Exception as e:
+        print(f"No se pudo leer el caché {ruta}: {str(e)}")
+        return None
+
+def guardar_cache(archivo, df, variante=None):
+    """Guarda el DataFrame de una revisión de Drive en formato Parquet y elimina las revisiones anteriores del archivo."""
+    ruta = ruta_cache(archivo, variante)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        # Escribir en un archivo temporal y renombrar para no dejar archivos a medias
+        ruta_tmp = ruta.with_suffix('.tmp')
+        df.to_parquet(ruta_tmp, index=False)
+        os.replace(ruta_tmp, ruta)
+        eliminar_revisiones_anteriores(archivo)
+        return True
+    except Exception as e:
+        print(f"No se pudo guardar el caché {ruta}: {str(e)}")
+        return False
+
+def _bytes_columna(serie):
+    """Bytes que identifican los valores de una columna, sin hashear fila por fila cuando no hace falta:
+    las columnas numéricas y de fechas aportan su memoria tal cual, las categóricas sus códigos y categorías,
+    y las de texto u object se factorizan (códigos y valores distintos).
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return (serie.cat.codes.to_numpy().tobytes()
+                + pd.util.hash_pandas_object(serie.cat.categories.to_series(), index=False).to_numpy().tobytes())
+    if isinstance(serie.dtype, pd.StringDtype) or serie.dtype == object:
+        # Texto (con o sin StringDtype): solo los valores distintos se hashean
+        codigos, unicos = pd.factorize(serie)
+        return codigos.tobytes() + pd.util.hash_pandas_object(pd.Series(unicos), index=False).to_numpy().tobytes()
+    if isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'biufmM':
+        return np.ascontiguousarray(serie.to_numpy()).tobytes()
+    return np.ascontiguousarray(pd.util.hash_pandas_object(serie, index=False).to_numpy()).tobytes()
+
+def huella_dataframe(df):
+    """Huella del contenido de un DataFrame: valores, índice, columnas y tipos.
+    Retorna None si el DataFrame tiene valores que no se pueden hashear.
+    """
+    h = hashlib.md5()
+    if df is None:
+        return 'None'
+    try:
+        h.update(repr([(str(col), str(tipo)) for col, tipo in df.dtypes.items()]).encode('utf-8'))
+        h.update(np.ascontiguousarray(pd.util.hash_pandas_object(df.index).to_numpy()).tobytes())
+        for posicion in range(df.shape[1]):
+            h.update(_bytes_columna(df.iloc[:, posicion]))
+    except TypeError as e:
+        print(f"No se pudo calcular la huella: {str(e)}")
+        return None
+    return h.hexdigest()
+
+def huella(*partes):
+    """Combina en una sola huella DataFrames, Series, arreglos y valores simples."""
+    h = hashlib.md5()
+    for parte in partes:
+        if isinstance(parte, np.ndarray):
+            parte = pd.Series(parte)
+        if isinstance(parte, pd.Series):
+            parte = parte.to_frame()
+        valor = huella_dataframe(parte) if isinstance(parte, pd.DataFrame) else repr(parte)
+        if valor is None:
+            return None
+        h.update(valor.encode('utf-8'))
+    return h.hexdigest()
+
+class MemoLRU:
+    """Resultados en memoria por clave, descartando los menos usados sobre max_entradas."""
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def leer(self, clave):
+        """Retorna el resultado guardado con la clave, o None si no está."""
+        if clave is None:
+            return None
+        with self._lock:
+            if clave not in self._entradas:
+                return None
+            self._entradas.move_to_end(clave)
+            return self._entradas[clave]
+
+    def guardar(self, clave, valor):
+        """Guarda un resultado, descartando los menos usados."""
+        if clave is None:
+            return
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entradas)
+
+_memo = MemoLRU(MAX_MEMO)
+
+def leer_memo(clave):
+    """Retorna el resultado guardado con la clave, o None si no está."""
+    return _memo.leer(clave)
+
+def guardar_memo(clave, valor):
+    """Guarda un resultado en memoria, descartando los menos usados sobre MAX_MEMO."""
+    _memo.guardar(clave, valor)
@@ -0,0 +1,79 @@
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+# Archivo de configuración del procesamiento (se puede cambiar con la variable de entorno)
+RUTA_CONFIGURACION = Path(os.environ.get(
+    'CONTROL_GESTION_CONFIG',
+    Path(__file__).resolve().parent.parent / 'config' / 'procesamiento.json'
+))
+
+BACKENDS = ('pandas', 'polars')
+
+# Cálculo de Horas Picking: 'rango' (primer inicio a último término) o 'activo' (unión de los intervalos, sin pausas)
+MODOS_HORAS = ('rango', 'activo')
+
+# Valores usados cuando el archivo no define una clave
+CONFIGURACION_POR_DEFECTO = {
+    'backend': 'pandas',
+    'incremental': False,
+    'modo_horas': 'rango',
+    'filas_por_pagina': 500,
+    'directorio_exportacion': '',
+    'meta_rendimiento': 310,
+    'meta_error': 0.0005,
+    # Empresas del reporte, usuarios IMAGEN y reasignación de empresas (los valores históricos del reporte)
+    'empresas': ["SAEP", "SINERGY", "J. CATALAN Y CIA. LTDA", "IMAGEN", "J. CATALAN Y CIA. LTDA RED BULL"],
+    'usuarios_imagen': ["SEBIGSEGO", "OPEREZVAR", "DIENIALPU"],
+    'reglas_empresa': [
+        {
+            'empresa': 'IMAGEN',
+            'si_empresa': 'J. CATALAN Y CIA. LTDA',
+            'picking': {'Tipo de pedido': ['3033-IMAGEN VIÑA'], 'id usuario': 'usuarios_imagen'},
+            'chequeo': {'Tipo de pedido': ['3033-IMAGEN VIÑA'], 'id usuario': 'usuarios_imagen'},
+        },
+        {
+            'empresa': 'J. CATALAN Y CIA. LTDA RED BULL',
+            'si_empresa': 'J. CATALAN Y CIA. LTDA',
+            'picking': {'Zona de Origen': ['Zona Trabajo Licores 02', 'Zona Trabajo Modula']},
+            'chequeo': {'zona_de_trabajo|Zona de trabajo': ['ZT-LIC-02', 'ZT-MOD']},
+        },
+    ],
+    # Condiciones que debe cumplir un grupo para entrar al rendimiento; "valor" puede ser otra columna
+    'reglas_anomalias': [
+        {'motivo': 'HORAS_NO_POSITIVAS', 'columna': 'Horas Picking', 'condicion': '>', 'valor': 0},
+        {'motivo': 'HORAS_EXCESIVAS', 'columna': 'Horas Picking', 'condicion': '<', 'valor': 12},
+        {'motivo': 'RENDIMIENTO_EXCESIVO', 'columna': 'Rendimiento', 'condicion': '<=', 'valor': 500},
+        {'motivo': 'RENDIMIENTO_NEGATIVO', 'columna': 'Rendimiento', 'condicion': '>=', 'valor': 0},
+        {'motivo': 'RENDIMIENTO_SOBRE_CAJAS', 'columna': 'Rendimiento', 'condicion': '<=', 'valor': 'Cajas'},
+    ],
+}
+
+@lru_cache(maxsize=None)
+def cargar_configuracion():
+    """Carga la configuración del procesamiento desde el archivo JSON, completando con los valores por defecto."""
+    configuracion = dict(CONFIGURACION_POR_DEFECTO)
+    if RUTA_CONFIGURACION.exists():
+        with open(RUTA_CONFIGURACION, encoding='utf-8') as archivo:
+            configuracion.update(json.load(archivo))
+
+    # La variable de entorno permite cambiar el backend sin editar el archivo
+    configuracion['backend'] = os.environ.get('CONTROL_GESTION_BACKEND', configuracion['backend'])
+    if configuracion['backend'] not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {configuracion['backend']}. Opciones: {', '.join(BACKENDS)}")
+    if configuracion['modo_horas'] not in MODOS_HORAS:
+        raise ValueError(f"Modo de horas desconocido: {configuracion['modo_horas']}. Opciones: {', '.join(MODOS_HORAS)}")
+    if not configuracion['empresas']:
+        raise ValueError(f"La configuración {RUTA_CONFIGURACION} no define empresas: el reporte quedaría vacío")
+
+    return configuracion
+
+def activar_copy_on_write():
+    """Activa copy-on-write en pandas 2 (en pandas 3 es el comportamiento por defecto).
+    El procesamiento no hace copias defensivas: depende de que modificar un DataFrame derivado
+    (un filtro, una copia superficial) no modifique el original.
+    """
+    import pandas as pd
+    if pd.__version__.split('.')[0] == '2':
+        pd.set_option('mode.copy_on_write', True)
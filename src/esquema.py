@@ -0,0 +1,61 @@
+import hashlib
+
+import pandas as pd
+
+# Esquema de ingesta: columnas que usa el pipeline y su tipo (None = tipo inferido).
+# Se incluyen los nombres originales del export y las alternativas que buscan las funciones.
+
+# Nombres posibles del identificador de pallet/LPN, en orden de preferencia. Son opcionales:
+# si el export los trae, la unión de descuentos por carga (src.pallets) también usa el pallet
+COLUMNAS_PALLET = ['LPN', 'lpn', 'Pallet', 'pallet', 'Id Pallet', 'id_pallet', 'Numero de pallet', 'numero_pallet']
+
+ESQUEMA_PICKING = {
+    'Id. de usuario de ultima seleccion': str,
+    'id usuario': str,
+    'Empresa': str,
+    'Fecha Entrega': None,
+    'Nivel de carga': str,
+    'Hora Inicio': None,
+    'Hora Termino': None,
+    'Cajas': 'float64',
+    'Zona de Origen': str,
+    'Tipo de pedido': str,
+    'Descripcion': str,
+    'Numero de carga': None,
+    **{col: None for col in COLUMNAS_PALLET},
+}
+
+ESQUEMA_CHEQUEO = {
+    'Nombre de grupo de autorizacion': str,
+    'empresa': str,
+    'Id. de usuario de ultima seleccion': str,
+    'id usuario': str,
+    'Tipo de pedido': str,
+    'zona_de_trabajo': str,
+    'Zona de trabajo': str,
+    'Cantidad de unidades': 'float64',
+    'Cantidad': 'float64',
+    'discqty': 'float64',
+    'Descuento': 'float64',
+    'Nombre de usuario': str,
+    'chequeador': str,
+    'id_chequeador': str,
+    'Numero de carga': None,
+    'consistencia': str,
+    'Codigo de Articulo': None,
+    'Descripcion': str,
+    **{col: None for col in COLUMNAS_PALLET},
+}
+
+def firma_esquema(esquema):
+    """Retorna una firma corta del esquema para versionar los cachés que dependen de él."""
+    texto = repr(sorted((col, getattr(tipo, '__name__', tipo)) for col, tipo in esquema.items()))
+    return hashlib.md5(texto.encode('utf-8')).hexdigest()[:8]
+
+def leer_excel(fuente, esquema=None, **kwargs):
+    """Lee un Excel proyectando solo las columnas del esquema y fijando sus tipos."""
+    if esquema is None:
+        return pd.read_excel(fuente, **kwargs)
+
+    dtypes = {col: tipo for col, tipo in esquema.items() if tipo is not None}
+    return pd.read_excel(fuente, usecols=lambda col: col in esquema, dtype=dtypes, **kwargs)
@@ -0,0 +1,107 @@
+import gzip
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from .cache import normalizar_tipos, huella, leer_memo, guardar_memo
+
+# Formatos de exportación para consumo automático (BI, remuneraciones): extensión de cada archivo
+FORMATOS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'csv.gz': '.csv.gz',
+}
+
+def tablas_exportacion(reporte_principal, nivel_carga, descuento_summary, df_picking, df_chequeo, tipo_fila=None,
+                       rechazos=None, por_pallet=None):
+    """Retorna las tablas a exportar por nombre de archivo. Las vacías o ausentes se omiten."""
+    if reporte_principal is not None and tipo_fila is not None:
+        reporte_principal = reporte_principal.assign(**{'Tipo Fila': tipo_fila})
+    if nivel_carga is not None:
+        nivel_carga = nivel_carga.reset_index()
+
+    tablas = {
+        'reporte': reporte_principal,
+        'nivel_carga': nivel_carga,
+        'descuentos': descuento_summary,
+        'datos_picking': df_picking,
+        'datos_chequeo': df_chequeo,
+        'rechazos': rechazos,
+        'descuentos_por_pallet': por_pallet,
+    }
+    return {nombre: df for nombre, df in tablas.items() if df is not None and not df.empty}
+
+def tabla_arrow(df):
+    """Convierte un DataFrame a una tabla de Arrow, con nombres de columna de texto y sin índice."""
+    return pa.Table.from_pandas(normalizar_tipos(df.copy(deep=False)), preserve_index=False)
+
+def escribir_tabla(tabla, formato, destino):
+    """Escribe una tabla de Arrow en el formato indicado en un archivo o buffer binario."""
+    if formato == 'parquet':
+        pq.write_table(tabla, destino)
+    elif formato == 'arrow':
+        with pa.ipc.new_file(destino, tabla.schema) as writer:
+            writer.write_table(tabla)
+    elif formato == 'csv.gz':
+        # Las columnas categóricas se escriben como sus valores
+        columnas = [col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col
+                    for col in tabla.columns]
+        with gzip.GzipFile(fileobj=destino, mode='wb', compresslevel=6) as archivo:
+            pa_csv.write_csv(pa.table(columnas, names=tabla.column_names), archivo)
+    else:
+        raise ValueError(f"Formato desconocido: {formato}. Opciones: {', '.join(FORMATOS)}")
+
+def exportar_formatos(tablas, formatos=tuple(FORMATOS)):
+    """Genera un archivo zip por formato con todas las tablas. Retorna {formato: bytes}.
+    Cada tabla se convierte a Arrow una sola vez y se escribe en todos los formatos desde ahí;
+    el resultado se guarda en memoria con la huella de las tablas.
+    """
+    clave = huella('formatos', tuple(formatos), *[parte for nombre, df in tablas.items() for parte in (nombre, df)])
+    paquetes = leer_memo(clave)
+    if paquetes is not None:
+        return paquetes
+
+    buffers = {formato: io.BytesIO() for formato in formatos}
+    zips = {formato: zipfile.ZipFile(buffers[formato], 'w', zipfile.ZIP_STORED) for formato in formatos}
+    try:
+        for nombre, df in tablas.items():
+            tabla = tabla_arrow(df)
+            for formato in formatos:
+                with zips[formato].open(nombre + FORMATOS[formato], 'w') as archivo:
+                    escribir_tabla(tabla, formato, archivo)
+    finally:
+        for archivo_zip in zips.values():
+            archivo_zip.close()
+
+    paquetes = {formato: buffer.getvalue() for formato, buffer in buffers.items()}
+    guardar_memo(clave, paquetes)
+    return paquetes
+
+def exportar_lote(tablas, directorio, formatos=tuple(FORMATOS)):
+    """Escribe todas las tablas en todos los formatos en un directorio (salida por lotes).
+    Cada archivo se escribe en un temporal y se renombra. Si las mismas tablas ya se escribieron en el
+    directorio no se vuelven a escribir. Retorna la lista de archivos escritos.
+    """
+    directorio = Path(directorio)
+    clave = huella('lote', str(directorio), tuple(formatos), *[parte for nombre, df in tablas.items() for parte in (nombre, df)])
+    if leer_memo(clave) is not None:
+        return []
+
+    directorio.mkdir(parents=True, exist_ok=True)
+    escritos = []
+    for nombre, df in tablas.items():
+        tabla = tabla_arrow(df)
+        for formato in formatos:
+            ruta = directorio / (nombre + FORMATOS[formato])
+            ruta_tmp = ruta.with_name(ruta.name + '.tmp')
+            with open(ruta_tmp, 'wb') as archivo:
+                escribir_tabla(tabla, formato, archivo)
+            os.replace(ruta_tmp, ruta)
+            escritos.append(ruta)
+    guardar_memo(clave, escritos)
+    return escritos
@@ -0,0 +1,82 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Formatos conocidos de los exports, en orden de preferencia (día primero, como dayfirst=True)
+FORMATOS_FECHA_HORA = [
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%d/%m/%Y %I:%M:%S %p',
+    '%d/%m/%Y %I:%M %p',
+    '%d/%m/%y %H:%M:%S',
+    '%d/%m/%y %H:%M',
+    '%d/%m/%Y',
+    '%Y-%m-%d',
+]
+
+# Formato detectado para cada firma de texto (dígitos reemplazados por 9)
+_formatos_detectados = {}
+
+def firma_texto(valor):
+    """Retorna la forma de un texto de fecha, por ejemplo '99/99/9999 99:99:99'."""
+    return re.sub(r'\d', '9', valor.strip())
+
+def detectar_formato(valores, tamano_muestra=50):
+    """Detecta el formato de una lista de textos de fecha probando los formatos conocidos sobre una muestra.
+    Se usa la forma más frecuente de la muestra y el resultado se guarda por firma, por lo que
+    cada forma de export se detecta una sola vez.
+    """
+    if len(valores) == 0:
+        return None
+
+    muestra = pd.Series(valores[:tamano_muestra]).str.strip()
+    firmas = muestra.map(firma_texto)
+    firma = firmas.mode().iloc[0]
+    if firma in _formatos_detectados:
+        return _formatos_detectados[firma]
+
+    muestra = muestra[firmas == firma]
+    formato_detectado = None
+    for formato in FORMATOS_FECHA_HORA:
+        if pd.to_datetime(muestra, format=formato, errors='coerce').notna().all():
+            formato_detectado = formato
+            break
+
+    _formatos_detectados[firma] = formato_detectado
+    return formato_detectado
+
+def parsear_fechas(serie):
+    """Convierte una columna de fechas/horas a datetime en una sola pasada vectorizada.
+    Cada texto distinto se convierte una sola vez con el formato detectado; los que no calzan
+    con ese formato se convierten por inferencia (dayfirst=True), como antes.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    codigos, unicos = pd.factorize(serie)
+    unicos = pd.Index(unicos)
+
+    if len(unicos) > 0 and unicos.map(lambda v: isinstance(v, str)).all():
+        formato = detectar_formato(unicos)
+        texto = unicos.str.strip()
+        if formato is not None:
+            convertidos = pd.to_datetime(texto, format=formato, errors='coerce').values.astype('datetime64[ns]')
+        else:
+            convertidos = np.full(len(unicos), np.datetime64('NaT', 'ns'))
+        # Solo los textos con otro formato se convierten por inferencia
+        pendientes = np.isnat(convertidos)
+        if pendientes.any():
+            convertidos[pendientes] = pd.to_datetime(
+                texto[pendientes], errors='coerce', dayfirst=True
+            ).values.astype('datetime64[ns]')
+    else:
+        convertidos = pd.to_datetime(unicos, errors='coerce', dayfirst=True).values.astype('datetime64[ns]')
+
+    # Mapear de vuelta a cada fila; el código -1 (nulo) toma el NaT agregado al final
+    valores = np.append(convertidos, np.datetime64('NaT', 'ns'))
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name)
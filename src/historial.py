@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from .cache import normalizar_tipos
+
+# Directorio del historial (se puede cambiar con la variable de entorno)
+HISTORIAL_DIR = Path(os.environ.get(
+    'CONTROL_GESTION_HISTORIAL_DIR',
+    Path.home() / '.local' / 'share' / 'control-de-gestion' / 'historial'
+))
+
+# Columnas de partición: fecha en formato ISO y empresa tal como viene en el export
+COLUMNA_FECHA = 'fecha'
+COLUMNA_EMPRESA = 'empresa_particion'
+COLUMNAS_EMPRESA = {'picking': 'Empresa', 'chequeo': 'empresa'}
+SIN_VALOR = 'SIN_ASIGNAR'
+
+# Origen de cada fila: archivo de Drive, fecha que reporta el export y revisión del archivo.
+# Un export es dueño de su fecha; las filas de otras fechas (atrasadas) se combinan con las ya guardadas.
+COLUMNA_ARCHIVO = 'origen_archivo'
+COLUMNA_FECHA_EXPORT = 'origen_fecha'
+COLUMNA_REVISION = 'origen_revision'
+COLUMNAS_ORIGEN = [COLUMNA_ARCHIVO, COLUMNA_FECHA_EXPORT, COLUMNA_REVISION]
+
+# Días en que Drive no tiene export (fines de semana, feriados): no se vuelven a consultar
+RUTA_SIN_EXPORT = HISTORIAL_DIR / 'dias_sin_export.json'
+
+# Evita que dos sesiones escriban el mismo día al mismo tiempo
+_lock_escritura = threading.Lock()
+
+def fechas_iso(serie):
+    """Convierte una columna de fechas del export a texto ISO (AAAA-MM-DD)."""
+    fechas = pd.to_datetime(serie, errors='coerce', dayfirst=True)
+    return fechas.dt.strftime('%Y-%m-%d').fillna(SIN_VALOR)
+
+def fecha_revision(archivo):
+    """Fecha ISO de modificación de un archivo de Drive (la fecha del export), o None si no se conoce."""
+    modificado = (archivo or {}).get('modifiedTime')
+    if not modificado:
+        return None
+    return pd.Timestamp(modificado).strftime('%Y-%m-%d')
+
+def _agregar_particiones(df, tipo, origen):
+    """Agrega las columnas de partición y de origen al DataFrame de un tipo de registro."""
+    df = normalizar_tipos(df.copy(deep=False))
+    if 'Fecha Entrega' in df.columns:
+        df[COLUMNA_FECHA] = fechas_iso(df['Fecha Entrega'])
+    else:
+        # El chequeo no trae fecha de entrega: sus filas quedan en la fecha de su propio export
+        df[COLUMNA_FECHA] = origen[COLUMNA_FECHA_EXPORT]
+
+    col_empresa = COLUMNAS_EMPRESA[tipo]
+    if col_empresa in df.columns:
+        df[COLUMNA_EMPRESA] = df[col_empresa].fillna(SIN_VALOR).astype(str)
+    else:
+        df[COLUMNA_EMPRESA] = SIN_VALOR
+    for col, valor in origen.items():
+        df[col] = valor
+    return df
+
+def _combinar_fecha(existente, nuevo, fecha, origen):
+    """Combina las filas guardadas de una fecha con las del export nuevo.
+    Las filas de revisiones anteriores del mismo export se reemplazan; si el export es dueño de la fecha
+    también se reemplazan las de otros exports, salvo las filas atrasadas de exports posteriores.
+    Retorna None si lo guardado proviene de una revisión más reciente del mismo export.
+    """
+    if existente.empty:
+        return nuevo
+    # Las filas guardadas antes de registrar el origen no pertenecen a ningún export
+    existente = existente.reindex(columns=existente.columns.union(COLUMNAS_ORIGEN, sort=False))
+    existente[COLUMNAS_ORIGEN] = existente[COLUMNAS_ORIGEN].fillna('').astype(str)
+    existente[COLUMNA_EMPRESA] = existente[COLUMNA_EMPRESA].astype(str)
+
+    mismo_export = ((existente[COLUMNA_ARCHIVO] == origen[COLUMNA_ARCHIVO]) &
+                    (existente[COLUMNA_FECHA_EXPORT] == origen[COLUMNA_FECHA_EXPORT]))
+    if (existente.loc[mismo_export, COLUMNA_REVISION] > origen[COLUMNA_REVISION]).any():
+        return None
+
+    conservar = ~mismo_export
+    if fecha == origen[COLUMNA_FECHA_EXPORT]:
+        conservar &= existente[COLUMNA_FECHA_EXPORT] > fecha
+    return pd.concat([existente[conservar].assign(**{COLUMNA_FECHA: fecha}), nuevo], ignore_index=True)
+
+def guardar_export(tipo, df, archivo=None, fecha_export=None):
+    """Guarda en el historial los registros normalizados de un export de picking o chequeo.
+    archivo son los metadatos de Drive del export. El export es dueño de fecha_export (por defecto, la fecha
+    principal del picking o la fecha del export de chequeo): esa fecha se reemplaza completa y las filas
+    atrasadas de otras fechas se agregan a lo ya guardado, por lo que guardar dos veces es idempotente.
+    """
+    archivo = archivo or {}
+    if fecha_export is None:
+        if tipo == 'picking':
+            fechas = fechas_iso(df['Fecha Entrega'])
+            fecha_export = fechas.mode().iloc[0] if not fechas.empty else SIN_VALOR
+        else:
+            fecha_export = fecha_revision(archivo) or SIN_VALOR
+    origen = {
+        COLUMNA_ARCHIVO: archivo.get('id', tipo),
+        COLUMNA_FECHA_EXPORT: fecha_export,
+        COLUMNA_REVISION: archivo.get('modifiedTime', ''),
+    }
+    df = _agregar_particiones(df, tipo, origen)
+    raiz = HISTORIAL_DIR / tipo
+
+    with _lock_escritura:
+        raiz.mkdir(parents=True, exist_ok=True)
+        # Cada fecha se reescribe con la combinación de lo guardado y lo nuevo
+        for fecha, nuevo in df.groupby(COLUMNA_FECHA, sort=False):
+            directorio = raiz / f"{COLUMNA_FECHA}={fecha}"
+            existente = pd.read_parquet(directorio) if directorio.exists() else pd.DataFrame()
+            combinado = _combinar_fecha(existente, nuevo, fecha, origen)
+            if combinado is None:
+                print(f"Historial {tipo} {fecha}: ya existe una revisión más reciente del export")
+                continue
+            shutil.rmtree(directorio, ignore_errors=True)
+            combinado.to_parquet(raiz, partition_cols=[COLUMNA_FECHA, COLUMNA_EMPRESA], index=False)
+
+def guardar_dia(df_picking, df_chequeo, revisiones=None):
+    """Guarda el picking y el chequeo del último reporte en el historial particionado.
+    revisiones ({'picking': metadatos, 'chequeo': metadatos} de Drive) identifica el origen de cada export;
+    sin metadatos, el chequeo queda en la fecha principal del picking.
+    """
+    try:
+        revisiones = revisiones or {}
+        fechas_picking = fechas_iso(df_picking['Fecha Entrega'])
+        fecha_principal = fechas_picking.mode().iloc[0] if not fechas_picking.empty else SIN_VALOR
+        guardar_export('picking', df_picking, revisiones.get('picking'), fecha_principal)
+        guardar_export('chequeo', df_chequeo, revisiones.get('chequeo'),
+                       fecha_revision(revisiones.get('chequeo')) or fecha_principal)
+        return True
+    except Exception as e:
+        print(f"No se pudo guardar el historial: {str(e)}")
+        return False
+
+def consultar_historial(tipo, desde, hasta, empresas=None, columnas=None, excluir=()):
+    """Consulta los registros de un tipo ('picking' o 'chequeo') en un rango de fechas, sin los días de excluir.
+    Los filtros de fecha y empresa se resuelven sobre las particiones, sin leer el resto de los archivos.
+    """
+    raiz = HISTORIAL_DIR / tipo
+    if not raiz.exists():
+        return pd.DataFrame()
+
+    filtros = [
+        (COLUMNA_FECHA, '>=', desde.isoformat()),
+        (COLUMNA_FECHA, '<=', hasta.isoformat())
+    ]
+    if empresas is not None:
+        filtros.append((COLUMNA_EMPRESA, 'in', list(empresas)))
+    if excluir:
+        filtros.append((COLUMNA_FECHA, 'not in', list(excluir)))
+
+    df = pd.read_parquet(raiz, filters=filtros, columns=columnas)
+    return df.drop(columns=[COLUMNA_FECHA, COLUMNA_EMPRESA] + COLUMNAS_ORIGEN, errors='ignore')
+
+def _leer_sin_export():
+    """Días ya consultados en Drive que no tienen export, por tipo: {'picking': [...], 'chequeo': [...]}."""
+    if not RUTA_SIN_EXPORT.exists():
+        return {}
+    try:
+        with open(RUTA_SIN_EXPORT, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except Exception as e:
+        print(f"No se pudo leer {RUTA_SIN_EXPORT}: {str(e)}")
+        return {}
+
+def marcar_dias_sin_export(tipo, dias):
+    """Registra los días en que Drive no tiene export del tipo, para no volver a consultarlos.
+    Solo se registran días anteriores a hoy: el export del día todavía puede llegar.
+    """
+    hoy = date.today().isoformat()
+    dias = [dia for dia in dias if dia < hoy]
+    if not dias:
+        return
+    with _lock_escritura:
+        registro = _leer_sin_export()
+        registro[tipo] = sorted(set(registro.get(tipo, [])) | set(dias))
+        RUTA_SIN_EXPORT.parent.mkdir(parents=True, exist_ok=True)
+        with open(RUTA_SIN_EXPORT, 'w', encoding='utf-8') as archivo:
+            json.dump(registro, archivo)
+
+def dias_sin_cobertura(tipo, desde, hasta):
+    """Días del rango sin un export propio guardado (solo filas atrasadas de otros exports, o nada),
+    descontando los días que Drive ya confirmó sin export.
+    """
+    sin_export = set(_leer_sin_export().get(tipo, []))
+    dias = [dia for dia in ((desde + timedelta(days=i)).isoformat() for i in range((hasta - desde).days + 1))
+            if dia not in sin_export]
+    raiz = HISTORIAL_DIR / tipo
+    if not raiz.exists():
+        return dias
+    filtros = [(COLUMNA_FECHA, '>=', desde.isoformat()), (COLUMNA_FECHA, '<=', hasta.isoformat())]
+    origen = pd.read_parquet(raiz, filters=filtros, columns=[COLUMNA_FECHA, COLUMNA_FECHA_EXPORT])
+    if COLUMNA_FECHA_EXPORT not in origen.columns:
+        return dias
+    propias = set(origen.loc[origen[COLUMNA_FECHA].astype(str) == origen[COLUMNA_FECHA_EXPORT], COLUMNA_FECHA_EXPORT])
+    return [dia for dia in dias if dia not in propias]
+
+def cargar_rango_historial(desde, hasta, empresas=None):
+    """Carga picking y chequeo del historial para un rango de fechas, solo de los días con su export guardado.
+    Retorna (df_picking, df_chequeo, faltantes), con faltantes = {'picking': días, 'chequeo': días} que hay que
+    traer de Drive, o (None, None, None) si el historial no se puede leer.
+    """
+    try:
+        faltantes = {tipo: dias_sin_cobertura(tipo, desde, hasta) for tipo in ('picking', 'chequeo')}
+        for tipo, dias in faltantes.items():
+            if dias:
+                print(f"Historial local sin {tipo} de {len(dias)} días ({', '.join(dias[:5])})")
+        df_picking = consultar_historial('picking', desde, hasta, empresas, excluir=faltantes['picking'])
+        df_chequeo = consultar_historial('chequeo', desde, hasta, empresas, excluir=faltantes['chequeo'])
+        return df_picking, df_chequeo, faltantes
+    except Exception as e:
+        print(f"No se pudo leer el historial: {str(e)}")
+        return None, None, None
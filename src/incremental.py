@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIR
+from .reglas import PK_IMAGEN, ORDER_EMPRESAS, REGLAS_EMPRESA, REGLAS_ANOMALIAS
+from .processing import (
+    CLAVES_PICKING,
+    CLAVES_CHEQUEO,
+    aplicar_transformaciones,
+    agrupar_picking,
+    agrupar_chequeo,
+    completar_columnas_chequeo,
+    calcular_rendimiento,
+    calcular_error,
+    unir_picking,
+    unir_datos
+)
+
+# Estado persistido entre actualizaciones: un solo archivo para que agregados y filas vistas sean consistentes
+RUTA_ESTADO = CACHE_DIR / 'incremental' / 'estado.pkl'
+
+# Agregación de cada tabla del estado al combinar lo acumulado con las filas nuevas
+AGREGACIONES = {
+    'others': {'Cajas': 'sum', 'Hora_Inicio_Min': 'min', 'Hora_Termino_Max': 'max'},
+    'imagen': {'Cajas': 'sum'},
+    'chequeo': {'Total_Unidades': 'sum', 'Total_Descuento': 'sum'},
+}
+
+# Filas usadas para reconocer que el export solo creció: repartidas en todo el export y al final
+TAMANO_MUESTRA = 256
+FILAS_FINALES = 64
+
+# Evita que dos sesiones actualicen el estado al mismo tiempo
+_lock_estado = threading.Lock()
+
+def firma_estado(df_picking, df_chequeo, modo_horas='rango'):
+    """Firma de lo que define los agregados: reglas de empresa y de anomalías, modo de horas,
+    usuarios IMAGEN, empresas y columnas de entrada.
+    Si cambia, el estado anterior no sirve y se reconstruye.
+    """
+    contenido = {
+        'reglas': REGLAS_EMPRESA,
+        'anomalias': REGLAS_ANOMALIAS,
+        'modo_horas': modo_horas,
+        'usuarios_imagen': sorted(PK_IMAGEN),
+        'empresas': ORDER_EMPRESAS,
+        'picking': [(col, str(tipo)) for col, tipo in df_picking.dtypes.items()],
+        'chequeo': [(col, str(tipo)) for col, tipo in df_chequeo.dtypes.items()],
+    }
+    return hashlib.md5(json.dumps(contenido, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def hashes_filas(df):
+    """Retorna un hash de 64 bits por fila, calculado sobre los valores (sin el índice)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def filas_nuevas(hashes, vistas):
+    """Identifica las filas que no estaban en la actualización anterior comparando los hashes de todas las filas.
+    Las filas repetidas se distinguen por su número de aparición, de modo que una fila idéntica agregada
+    al final también cuenta como nueva. Retorna (mascara de filas nuevas, conteo actual por hash,
+    False si desaparecieron filas ya vistas y el estado no sirve).
+    """
+    serie = pd.Series(hashes)
+    ocurrencia = serie.groupby(serie).cumcount().to_numpy()
+    previas = vistas.reindex(hashes, fill_value=0).to_numpy()
+    conteo = serie.value_counts()
+    consistente = bool((conteo.reindex(vistas.index, fill_value=0) >= vistas).all())
+    return ocurrencia >= previas, conteo, consistente
+
+def muestra_filas(df):
+    """Retorna las posiciones de muestra de un export y el hash de esas filas."""
+    n = len(df)
+    posiciones = np.unique(np.concatenate([
+        np.linspace(0, n - 1, min(n, TAMANO_MUESTRA)).astype(np.int64),
+        np.arange(max(n - FILAS_FINALES, 0), n)
+    ])) if n else np.array([], dtype=np.int64)
+    return posiciones, hashes_filas(df.iloc[posiciones])
+
+def huella_filas(hashes):
+    """Resume los hashes por fila de un export (en orden) en una sola huella."""
+    return hashlib.md5(np.ascontiguousarray(hashes).tobytes()).hexdigest()
+
+def detectar_filas_nuevas(df, vistas):
+    """Retorna (mascara de filas nuevas, nuevo registro de filas vistas, False si el estado no sirve).
+    Si el export solo creció (las filas anteriores siguen iguales en las mismas posiciones) solo se cuentan
+    las filas agregadas; si no, se comparan los hashes de todas las filas. La muestra descarta rápido los
+    exports que cambiaron, pero el camino rápido solo se acepta si la huella de todas las filas anteriores
+    coincide, de modo que una fila editada fuera de la muestra también se detecta.
+    """
+    n_previas = vistas['filas']
+    posiciones, hashes_muestra = vistas['muestra']
+    hashes = None
+    if n_previas and len(df) >= n_previas and np.array_equal(hashes_filas(df.iloc[posiciones]), hashes_muestra):
+        hashes_previas = hashes_filas(df.iloc[:n_previas])
+        if huella_filas(hashes_previas) == vistas.get('huella'):
+            hashes_agregadas = hashes_filas(df.iloc[n_previas:])
+            agregadas = pd.Series(hashes_agregadas).value_counts()
+            conteo = vistas['conteo'].add(agregadas, fill_value=0).astype('int64')
+            nuevas = np.arange(len(df)) >= n_previas
+            consistente = True
+            hashes = np.concatenate([hashes_previas, hashes_agregadas])
+    if hashes is None:
+        hashes = hashes_filas(df)
+        nuevas, conteo, consistente = filas_nuevas(hashes, vistas['conteo'])
+    registro = {'filas': len(df), 'muestra': muestra_filas(df), 'huella': huella_filas(hashes), 'conteo': conteo}
+    return nuevas, registro, consistente
+
+def _vistas_vacias():
+    """Registro de filas vistas de un export que aún no se procesó."""
+    return {'filas': 0, 'muestra': (np.array([], dtype=np.int64), np.array([], dtype=np.uint64)),
+            'huella': None, 'conteo': pd.Series(dtype='int64')}
+
+def _estado_vacio(firma):
+    """Crea un estado sin filas vistas ni agregados."""
+    return {
+        'firma': firma,
+        'filas_picking': _vistas_vacias(),
+        'filas_chequeo': _vistas_vacias(),
+        'others': None,
+        'imagen': None,
+        'validos': None,
+        'rechazos': None,
+        'chequeo': None,
+        'errores': None,
+    }
+
+def _leer_estado():
+    """Lee el estado persistido, o retorna None si no existe o no se puede leer."""
+    if not RUTA_ESTADO.exists():
+        return None
+    try:
+        return pd.read_pickle(RUTA_ESTADO)
+    except Exception as e:
+        print(f"No se pudo leer el estado incremental: {str(e)}")
+        return None
+
+def _guardar_estado(estado):
+    """Guarda el estado escribiendo un archivo temporal y renombrándolo."""
+    try:
+        RUTA_ESTADO.parent.mkdir(parents=True, exist_ok=True)
+        ruta_tmp = RUTA_ESTADO.with_suffix('.tmp')
+        pd.to_pickle(estado, ruta_tmp)
+        os.replace(ruta_tmp, RUTA_ESTADO)
+    except Exception as e:
+        print(f"No se pudo guardar el estado incremental: {str(e)}")
+
+def _indexar(df, claves):
+    """Indexa un agregado por sus claves, con los valores como objetos para que no dependan de las categorías."""
+    df = df.copy(deep=False)
+    df[claves] = df[claves].astype(object)
+    return df.set_index(claves)
+
+def _reemplazar(acumulado, nuevos, afectados):
+    """Reemplaza en el acumulado las filas de los grupos afectados."""
+    if acumulado is None or acumulado.empty:
+        return nuevos
+    return pd.concat([acumulado.drop(index=afectados, errors='ignore'), nuevos])
+
+def _acumular(acumulado, delta, agregaciones):
+    """Combina los agregados de las filas nuevas con lo acumulado, solo para los grupos que cambiaron.
+    Retorna (acumulado actualizado, grupos afectados con sus valores combinados).
+    """
+    if acumulado is None or acumulado.empty:
+        return delta, delta
+    if delta.empty:
+        return acumulado, delta
+    previos = acumulado[acumulado.index.isin(delta.index)]
+    combinados = pd.concat([previos, delta]).groupby(level=list(range(delta.index.nlevels))).agg(agregaciones)
+    return _reemplazar(acumulado, combinados, delta.index), combinados
+
+def _a_filas(df, claves, tipos):
+    """Convierte un agregado del estado en filas con los tipos del dataframe actual, en el orden de groupby."""
+    df = df.reset_index()
+    for col in claves:
+        df[col] = df[col].astype(tipos[col])
+    return df.sort_values(claves, kind='stable').reset_index(drop=True)
+
+def procesar_incremental(df_picking, df_chequeo, modo_horas='rango', devolver_rechazos=False):
+    """Equivalente a aplicar_transformaciones + procesar_picking + procesar_chequeo + unir_datos,
+    pero agregando solo las filas nuevas desde la actualización anterior. Rendimiento y % de error
+    se recalculan solo para los grupos afectados. Retorna (df_picking, df_chequeo, df_final);
+    con devolver_rechazos=True agrega los grupos rechazados por las reglas de anomalías.
+    """
+    with _lock_estado:
+        firma = firma_estado(df_picking, df_chequeo, modo_horas)
+
+        estado = _leer_estado()
+        if estado is None or estado['firma'] != firma:
+            estado = _estado_vacio(firma)
+        nuevas_picking, vistas_picking, consistente_picking = detectar_filas_nuevas(df_picking, estado['filas_picking'])
+        nuevas_chequeo, vistas_chequeo, consistente_chequeo = detectar_filas_nuevas(df_chequeo, estado['filas_chequeo'])
+
+        # Si desaparecieron filas (export de otro día o corregido) se reconstruye desde cero
+        if not (consistente_picking and consistente_chequeo):
+            estado = _estado_vacio(firma)
+            nuevas_picking, vistas_picking, _ = detectar_filas_nuevas(df_picking, estado['filas_picking'])
+            nuevas_chequeo, vistas_chequeo, _ = detectar_filas_nuevas(df_chequeo, estado['filas_chequeo'])
+
+        nuevas_picking = pd.Series(nuevas_picking, index=df_picking.index)
+        nuevas_chequeo = pd.Series(nuevas_chequeo, index=df_chequeo.index)
+        print(f"Incremental: {int(nuevas_picking.sum())} filas nuevas de picking, "
+              f"{int(nuevas_chequeo.sum())} de chequeo")
+
+        # Las reglas de empresa y el filtro son por fila: se aplican al export completo
+        df_picking, df_chequeo = aplicar_transformaciones(df_picking, df_chequeo)
+        df_chequeo = completar_columnas_chequeo(df_chequeo)
+        delta_picking = df_picking[nuevas_picking.reindex(df_picking.index).to_numpy()]
+        delta_chequeo = df_chequeo[nuevas_chequeo.reindex(df_chequeo.index).to_numpy()]
+
+        # Picking: acumular y recalcular el rendimiento de los grupos afectados
+        cajas_others, cajas_imagen = agrupar_picking(delta_picking)
+        estado['others'], afectados = _acumular(
+            estado['others'], _indexar(cajas_others, CLAVES_PICKING), AGREGACIONES['others'])
+        estado['imagen'], _ = _acumular(
+            estado['imagen'], _indexar(cajas_imagen, CLAVES_PICKING), AGREGACIONES['imagen'])
+        if not afectados.empty or estado['validos'] is None:
+            validos, rechazados = calcular_rendimiento(afectados.reset_index(), devolver_rechazos=True)
+            estado['validos'] = _reemplazar(estado['validos'], validos.set_index(CLAVES_PICKING), afectados.index)
+            estado['rechazos'] = _reemplazar(estado['rechazos'], rechazados.set_index(CLAVES_PICKING), afectados.index)
+
+        # Chequeo: acumular y recalcular el % de error de los grupos afectados
+        pallet_delta = agrupar_chequeo(delta_chequeo)
+        estado['chequeo'], afectados = _acumular(
+            estado['chequeo'], _indexar(pallet_delta, CLAVES_CHEQUEO), AGREGACIONES['chequeo'])
+        if not afectados.empty or estado['errores'] is None:
+            errores = calcular_error(afectados.copy(deep=False))
+            estado['errores'] = _reemplazar(estado['errores'], errores, afectados.index)
+
+        estado['filas_picking'] = vistas_picking
+        estado['filas_chequeo'] = vistas_chequeo
+        _guardar_estado(estado)
+
+    # Reconstruir los resultados con los tipos y el orden del procesamiento completo
+    tipos_picking = df_picking.dtypes
+    df_valid = unir_picking(
+        _a_filas(estado['validos'], CLAVES_PICKING, tipos_picking),
+        _a_filas(estado['imagen'], CLAVES_PICKING, tipos_picking)
+    )
+    pallet_grouped = _a_filas(estado['errores'], CLAVES_CHEQUEO, df_chequeo.dtypes)
+    resultado = (df_picking, df_chequeo, unir_datos(df_valid, pallet_grouped))
+    if devolver_rechazos:
+        return resultado + (_a_filas(estado['rechazos'], CLAVES_PICKING, tipos_picking),)
+    return resultado
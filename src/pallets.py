@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from .esquema import COLUMNAS_PALLET
+from .processing import completar_columnas_chequeo
+
+# Columna de carga; el pallet/LPN (COLUMNAS_PALLET, opcional en el esquema de ingesta) se agrega si ambos exports lo traen
+COLUMNA_CARGA = 'Numero de carga'
+
+# Detalle de picking con el que se reparten los descuentos de cada carga o pallet
+COLUMNAS_PICKING_PALLET = ['id usuario', 'Empresa']
+
+def claves_pallet(df_picking, df_chequeo):
+    """Retorna las columnas de unión presentes en ambos registros: la carga y, si existe, el pallet.
+    Retorna None si alguno de los dos no trae el número de carga.
+    """
+    if COLUMNA_CARGA not in df_picking.columns or COLUMNA_CARGA not in df_chequeo.columns:
+        return None
+    pallet = next((col for col in COLUMNAS_PALLET if col in df_picking.columns and col in df_chequeo.columns), None)
+    return [COLUMNA_CARGA] if pallet is None else [COLUMNA_CARGA, pallet]
+
+def texto_clave(valores):
+    """Convierte valores de una clave a texto comparable entre exports: sin espacios y con los números enteros
+    sin decimales, de modo que 12345.0 (carga leída como número) y "12345" (leída como texto) coinciden.
+    """
+    texto = pd.Series(valores, dtype=object).astype(str).str.strip()
+    numeros = pd.to_numeric(texto, errors='coerce')
+    enteros = numeros.notna() & (numeros % 1 == 0) & (numeros.abs() < 2**53)
+    texto[enteros] = numeros[enteros].astype('int64').astype(str)
+    return pd.Index(texto, dtype=object)
+
+def codigos_compartidos(izquierda, derecha):
+    """Códigos enteros de dos columnas sobre las mismas categorías ordenadas (-1 para nulos).
+    Cada columna se factoriza por separado y solo sus valores distintos se llevan a las categorías comunes;
+    si los tipos no coinciden (carga numérica en un export y texto en el otro) se comparan con texto_clave.
+    Retorna (códigos izquierda, códigos derecha, categorías).
+    """
+    codigos_izq, unicos_izq = pd.factorize(izquierda)
+    codigos_der, unicos_der = pd.factorize(derecha)
+    if unicos_izq.dtype != unicos_der.dtype and not (pd.api.types.is_numeric_dtype(unicos_izq)
+                                                     and pd.api.types.is_numeric_dtype(unicos_der)):
+        unicos_izq, unicos_der = texto_clave(unicos_izq), texto_clave(unicos_der)
+    # Al normalizar, dos valores distintos pueden quedar iguales: las categorías no se repiten
+    categorias = pd.Index(unicos_izq).union(pd.Index(unicos_der)).unique()
+
+    def a_categorias(codigos, unicos):
+        # El -1 de los nulos cae en el -1 agregado al final de la tabla
+        tabla = np.append(categorias.get_indexer(unicos), -1).astype(np.int64)
+        return tabla[codigos]
+
+    return a_categorias(codigos_izq, unicos_izq), a_categorias(codigos_der, unicos_der), categorias
+
+def codificar_claves(df_izquierda, df_derecha, claves):
+    """Combina las columnas clave en un solo código entero por fila (base mixta sobre los códigos de cada columna),
+    igual en ambos dataframes; las filas con alguna clave nula quedan en -1.
+    Retorna (códigos izquierda, códigos derecha, categorías de cada clave).
+    """
+    codigo_izq = np.zeros(len(df_izquierda), dtype=np.int64)
+    codigo_der = np.zeros(len(df_derecha), dtype=np.int64)
+    nulos_izq = np.zeros(len(df_izquierda), dtype=bool)
+    nulos_der = np.zeros(len(df_derecha), dtype=bool)
+    categorias = []
+    for col in claves:
+        izq, der, cats = codigos_compartidos(df_izquierda[col], df_derecha[col])
+        codigo_izq = codigo_izq * len(cats) + izq
+        codigo_der = codigo_der * len(cats) + der
+        nulos_izq |= izq < 0
+        nulos_der |= der < 0
+        categorias.append(cats)
+    codigo_izq[nulos_izq] = -1
+    codigo_der[nulos_der] = -1
+    return codigo_izq, codigo_der, categorias
+
+def decodificar_claves(codigos, claves, categorias):
+    """Recupera los valores de cada clave a partir del código combinado."""
+    columnas = {}
+    for col, cats in reversed(list(zip(claves, categorias))):
+        codigos, resto = np.divmod(codigos, len(cats))
+        columnas[col] = cats.take(resto)
+    return pd.DataFrame({col: columnas[col] for col in claves})
+
+def _sumar_por_codigo(codigos, *valores):
+    """Suma cada arreglo de valores por código (se ignoran los -1). Retorna (códigos ordenados, sumas...)."""
+    con_codigo = codigos >= 0
+    unicos, posicion = np.unique(codigos[con_codigo], return_inverse=True)
+    return (unicos,) + tuple(np.bincount(posicion, weights=v[con_codigo], minlength=len(unicos)) for v in valores)
+
+def _buscar(ordenados, codigos):
+    """Posición de cada código entre los códigos ordenados y si se encontró (búsqueda binaria)."""
+    if not len(ordenados):
+        return np.zeros(len(codigos), dtype=np.int64), np.zeros(len(codigos), dtype=bool)
+    posicion = np.minimum(np.searchsorted(ordenados, codigos), len(ordenados) - 1)
+    return posicion, ordenados[posicion] == codigos
+
+def unir_por_pallet(df_picking, df_chequeo):
+    """Atribuye los descuentos del chequeo a las cargas (y pallets, si el export los trae) del picking.
+    El chequeo se agrega primero a una fila por código, ordenada; cada grupo de picking (clave, usuario, empresa)
+    busca su código con searchsorted, por lo que la unión es muchos a uno y nunca genera un producto cartesiano.
+    Las líneas del chequeo con usuario y empresa se atribuyen al grupo de picking de ese usuario en la misma clave;
+    solo las líneas sin usuario se reparten entre los grupos de la clave en proporción a las cajas.
+    Retorna None si los registros no traen el número de carga.
+    """
+    try:
+        claves = claves_pallet(df_picking, df_chequeo)
+        if claves is None:
+            print(f"Unión por pallet: falta la columna '{COLUMNA_CARGA}' en picking o chequeo")
+            return None
+
+        # El chequeo usa 'empresa': se renombra para codificar las mismas columnas en ambos registros
+        df_chequeo = completar_columnas_chequeo(df_chequeo.copy(deep=False)).rename(columns={'empresa': 'Empresa'})
+        por_usuario = all(col in df_chequeo.columns for col in COLUMNAS_PICKING_PALLET)
+        codigo_picking, codigo_chequeo, categorias = codificar_claves(df_picking, df_chequeo, claves)
+        if por_usuario:
+            usuario_picking, usuario_chequeo, _ = codificar_claves(df_picking, df_chequeo, claves + COLUMNAS_PICKING_PALLET)
+        else:
+            usuario_picking = np.full(len(df_picking), -1, dtype=np.int64)
+            usuario_chequeo = np.full(len(df_chequeo), -1, dtype=np.int64)
+
+        unidades = df_chequeo['Cantidad de unidades'].to_numpy(dtype=float, na_value=0)
+        descuento = df_chequeo['discqty'].to_numpy(dtype=float, na_value=0)
+        sin_usuario = (usuario_chequeo < 0).astype(float)
+
+        # Chequeo: totales por clave, lo que no tiene usuario por clave, y lo de cada usuario por clave
+        claves_chequeo, total_unidades, total_descuento, unidades_sin, descuento_sin = _sumar_por_codigo(
+            codigo_chequeo, unidades, descuento, unidades * sin_usuario, descuento * sin_usuario)
+        usuarios_chequeo, unidades_usuario, descuento_usuario = _sumar_por_codigo(usuario_chequeo, unidades, descuento)
+
+        # Picking: cajas por clave, usuario y empresa
+        grupos = (
+            df_picking[COLUMNAS_PICKING_PALLET].assign(_clave=codigo_picking, _usuario=usuario_picking, Cajas=df_picking['Cajas'])
+            [codigo_picking >= 0]
+            .groupby(['_clave', '_usuario'] + COLUMNAS_PICKING_PALLET, observed=True, sort=True)['Cajas'].sum()
+            .reset_index()
+        )
+        clave = grupos.pop('_clave').to_numpy()
+        usuario = grupos.pop('_usuario').to_numpy()
+
+        # Búsqueda de cada clave de picking entre las claves ordenadas del chequeo
+        posicion, encontrada = _buscar(claves_chequeo, clave)
+        if len(clave) and len(claves_chequeo) and not encontrada.any():
+            mensaje = (f"Unión por pallet: ninguna clave ({', '.join(claves)}) del picking coincide con el chequeo; "
+                       "revise el formato de las columnas en ambos exports")
+            print(mensaje)
+            st.warning(mensaje)
+        grupos = grupos[encontrada].reset_index(drop=True)
+        clave, usuario, posicion = clave[encontrada], usuario[encontrada], posicion[encontrada]
+
+        # Lo del propio usuario se atribuye completo; lo sin usuario se reparte según las cajas de cada grupo
+        posicion_usuario, propia = _buscar(usuarios_chequeo, usuario)
+        propias_unidades = np.where(propia, unidades_usuario[posicion_usuario] if len(usuarios_chequeo) else 0, 0)
+        propio_descuento = np.where(propia, descuento_usuario[posicion_usuario] if len(usuarios_chequeo) else 0, 0)
+        _, grupo_clave = np.unique(clave, return_inverse=True)
+        cajas = grupos['Cajas'].to_numpy(dtype=float, na_value=0)
+        cajas_clave = np.bincount(grupo_clave, weights=cajas)[grupo_clave]
+        participacion = np.divide(cajas, cajas_clave, out=np.zeros_like(cajas), where=cajas_clave > 0)
+        unidades_atribuidas = propias_unidades + unidades_sin[posicion] * participacion
+        descuento_atribuido = propio_descuento + descuento_sin[posicion] * participacion
+
+        resultado = pd.concat([decodificar_claves(clave, claves, categorias), grupos], axis=1)
+        resultado['Total_Unidades'] = total_unidades[posicion]
+        resultado['Total_Descuento'] = total_descuento[posicion]
+        resultado['Unidades Atribuidas'] = unidades_atribuidas.round(2)
+        resultado['Descuento Atribuido'] = descuento_atribuido.round(2)
+        resultado['% Error'] = np.divide(descuento_atribuido, unidades_atribuidas,
+                                         out=np.zeros(len(resultado)), where=unidades_atribuidas > 0) * 100
+        resultado['% Error'] = resultado['% Error'].round(2)
+
+        sin_picking = np.setdiff1d(claves_chequeo, clave)
+        if len(sin_picking):
+            descuento_sin_picking = total_descuento[np.searchsorted(claves_chequeo, sin_picking)].sum()
+            print(f"Unión por pallet: {len(sin_picking)} claves del chequeo sin picking ({descuento_sin_picking:,.0f} de descuento)")
+        usuario_sin_picking = np.setdiff1d(usuarios_chequeo, usuario)
+        if len(usuario_sin_picking):
+            descuento_usuario_sin_picking = descuento_usuario[np.searchsorted(usuarios_chequeo, usuario_sin_picking)].sum()
+            print(f"Unión por pallet: {len(usuario_sin_picking)} usuarios del chequeo sin picking en su clave "
+                  f"({descuento_usuario_sin_picking:,.0f} de descuento sin atribuir)")
+        return resultado
+    except Exception as e:
+        st.error(f"Error en unir_por_pallet: {str(e)}")
+        return None
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, NamedTuple
+
+import pandas as pd
+
+from .cache import MemoLRU, huella
+from .processing import (
+    transformar_registros,
+    procesar_picking,
+    procesar_chequeo,
+    unir_datos,
+    ejecutar_procesamiento,
+    create_grouped_report,
+    calcular_indicadores
+)
+from .visualization import create_nivel_carga_summary, create_descuento_summary
+from .volumen import volumen_por_hora
+from .pallets import unir_por_pallet
+
+# Resultados de los nodos en memoria: alcanza para varias versiones de cada etapa
+MAX_NODOS = 64
+
+_memo_nodos = MemoLRU(MAX_NODOS)
+
+# Medición de memoria por etapa (tracemalloc y RSS); activarla hace más lento el procesamiento
+PERFIL_MEMORIA = os.environ.get('CONTROL_GESTION_PERFIL_MEMORIA', '') not in ('', '0')
+
+class MedicionEtapa(NamedTuple):
+    """Tiempo y memoria de una etapa, en segundos y MB."""
+    etapa: str
+    segundos: float
+    pico_python_mb: float
+    rss_mb: float
+    pico_rss_mb: float
+
+def _memoria_proceso():
+    """Retorna (RSS actual, pico de RSS del proceso) en MB, o NaN si no se pueden leer."""
+    valores = {}
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith(('VmRSS:', 'VmHWM:')):
+                    nombre, valor = linea.split(':')
+                    valores[nombre] = int(valor.split()[0]) / 1024
+    except OSError:
+        import resource
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        valores['VmHWM'] = pico / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024)
+    return valores.get('VmRSS', float('nan')), valores.get('VmHWM', float('nan'))
+
+@contextmanager
+def medir_etapa(etapa, perfil):
+    """Agrega a perfil la medición de la etapa: tiempo, pico de memoria asignada por Python
+    (tracemalloc, incluye los arreglos de NumPy) y RSS del proceso al terminar.
+    """
+    if perfil is None:
+        yield
+        return
+    iniciado = tracemalloc.is_tracing()
+    if not iniciado:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        if not iniciado:
+            tracemalloc.stop()
+        rss, pico_rss = _memoria_proceso()
+        perfil.append(MedicionEtapa(etapa, segundos, (pico - base) / 2**20, rss, pico_rss))
+
+def reporte_memoria(perfil):
+    """Convierte las mediciones en un DataFrame e imprime el resumen."""
+    df = pd.DataFrame(perfil, columns=MedicionEtapa._fields)
+    if not df.empty:
+        print("Memoria por etapa (MB):")
+        print(df.round(3).to_string(index=False))
+    return df
+
+class Nodo(NamedTuple):
+    """Etapa del reporte: función, nombres de sus entradas (datos u otras etapas) y de los parámetros que usa.
+    Si la función retorna varias salidas con nombre, se declaran en salidas.
+    """
+    funcion: Callable
+    entradas: tuple
+    parametros: tuple = ()
+    salidas: tuple = ()
+
+def grafo_reporte(backend='pandas', incremental=False):
+    """Retorna las etapas del reporte por nombre. Con el backend pandas cada etapa del procesamiento es un nodo;
+    con polars o en modo incremental el procesamiento completo es un solo nodo, que entrega también
+    los grupos rechazados que evaluó.
+    """
+    if backend == 'pandas' and not incremental:
+        nodos = {
+            'picking_transformado': Nodo(partial(transformar_registros, tipo='picking'), ('picking',)),
+            'chequeo_transformado': Nodo(partial(transformar_registros, tipo='chequeo'), ('chequeo',)),
+            'picking_valido': Nodo(partial(procesar_picking, devolver_rechazos=True), ('picking_transformado',), ('modo_horas',),
+                                   salidas=('picking_valido', 'rechazos')),
+            'chequeo_agrupado': Nodo(procesar_chequeo, ('chequeo_transformado',)),
+            'final': Nodo(unir_datos, ('picking_valido', 'chequeo_agrupado')),
+        }
+    else:
+        nodos = {
+            'procesamiento': Nodo(partial(ejecutar_procesamiento, devolver_rechazos=True), ('picking', 'chequeo'),
+                                  ('backend', 'incremental', 'modo_horas'),
+                                  salidas=('picking_transformado', 'chequeo_transformado', 'final', 'rechazos')),
+        }
+
+    nodos.update({
+        'reporte': Nodo(create_grouped_report, ('final',)),
+        'indicadores': Nodo(calcular_indicadores, ('final', 'reporte'), ('meta_rendimiento', 'meta_error')),
+        'nivel_carga': Nodo(create_nivel_carga_summary, ('picking',)),
+        'descuentos': Nodo(create_descuento_summary, ('chequeo_transformado',)),
+        'volumen': Nodo(volumen_por_hora, ('picking_transformado',)),
+        'por_pallet': Nodo(unir_por_pallet, ('picking_transformado', 'chequeo_transformado')),
+    })
+    return nodos
+
+def _sin_mutacion(valor):
+    """Copia superficial de los DataFrames que recibe o entrega un nodo, para que los resultados
+    guardados no cambien si una etapa agrega o reemplaza columnas.
+    """
+    return valor.copy(deep=False) if isinstance(valor, pd.DataFrame) else valor
+
+def ejecutar_pipeline(nodos, datos, parametros, salidas, perfil=None):
+    """Calcula las salidas pedidas del grafo, reutilizando las etapas cuyas entradas no cambiaron.
+    La clave de cada etapa combina su nombre, sus parámetros y las claves de sus entradas (árbol de Merkle):
+    los datos se identifican por su contenido, de modo que un cambio en un dato o parámetro solo recalcula
+    las etapas que dependen de él. Si se pasa una lista en perfil, se agrega la medición de cada etapa calculada.
+    Retorna {salida: valor}.
+    """
+    productor = {}
+    for nombre, nodo in nodos.items():
+        for salida in nodo.salidas or (nombre,):
+            productor[salida] = nombre
+
+    claves = {nombre: huella('dato', nombre, df) for nombre, df in datos.items()}
+    valores = {}
+
+    def clave_nodo(nombre):
+        if nombre not in claves:
+            nodo = nodos[nombre]
+            partes = [nombre] + [(p, parametros[p]) for p in nodo.parametros]
+            partes += [clave_salida(entrada) for entrada in nodo.entradas]
+            claves[nombre] = None if None in partes else hashlib.md5(repr(partes).encode('utf-8')).hexdigest()
+        return claves[nombre]
+
+    def clave_salida(salida):
+        if salida in datos:
+            return claves[salida]
+        clave = clave_nodo(productor[salida])
+        return None if clave is None else f"{clave}:{salida}"
+
+    def calcular(salida):
+        if salida in valores:
+            return valores[salida]
+        if salida in datos:
+            return datos[salida]
+
+        nombre = productor[salida]
+        nodo = nodos[nombre]
+        clave = clave_nodo(nombre)
+        resultado = _memo_nodos.leer(clave)
+        if resultado is None:
+            argumentos = [_sin_mutacion(calcular(entrada)) for entrada in nodo.entradas]
+            with medir_etapa(nombre, perfil):
+                resultado = nodo.funcion(*argumentos, **{p: parametros[p] for p in nodo.parametros})
+            resultado = dict(zip(nodo.salidas, resultado)) if nodo.salidas else {nombre: resultado}
+            # Los errores de una etapa se muestran en cada ejecución: no se guardan
+            if all(valor is not None for valor in resultado.values()):
+                _memo_nodos.guardar(clave, resultado)
+        else:
+            print(f"Pipeline: '{nombre}' sin cambios, se reutiliza")
+        valores.update(resultado)
+        return valores[salida]
+
+    return {salida: _sin_mutacion(calcular(salida)) for salida in salidas}
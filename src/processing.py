@@ -3,250 +3,568 @@ import numpy as np
 import streamlit as st
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.http import MediaIoBaseDownload, HttpRequest
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import io
+import time
+import threading
+from datetime import date, timedelta
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from .cache import leer_cache, guardar_cache, normalizar_tipos
+from .historial import guardar_dia, guardar_export, cargar_rango_historial, marcar_dias_sin_export, fechas_iso, fecha_revision
+from .fechas import parsear_fechas
+from .config import cargar_configuracion
+from .esquema import ESQUEMA_PICKING, ESQUEMA_CHEQUEO, firma_esquema, leer_excel
+from .reglas import PK_IMAGEN, ORDER_EMPRESAS, COLUMNAS_EMPRESA, aplicar_reglas_empresa, evaluar_anomalias
 
-# Definición de constantes
-PK_IMAGEN = {'SEBIGSEGO', 'OPEREZVAR', 'DIENIALPU'}
-ZONA_TRABAJO = {'Zona Trabajo Licores 02', 'Zona Trabajo Modula'}
-ZONA_CHEQUEO = {'ZT-LIC-02', 'ZT-MOD'}
-ORDER_EMPRESAS = ["SAEP", "SINERGY", "J. CATALAN Y CIA. LTDA", "IMAGEN", "J. CATALAN Y CIA. LTDA RED BULL"]
+# Definición de constantes (usuarios IMAGEN, empresas y reglas de reasignación en config/procesamiento.json)
+# Claves de agrupación del picking (rendimiento) y del chequeo (errores)
+CLAVES_PICKING = ['id usuario', 'Empresa', 'Descripcion', 'Fecha Entrega']
+CLAVES_CHEQUEO = ['id usuario', 'empresa']
+# Tabla de grupos excluidos del rendimiento, con el motivo (regla de anomalías) de cada uno
+COLUMNAS_RECHAZOS = CLAVES_PICKING + ['Cajas', 'Horas Picking', 'Rendimiento', 'Motivo']
+MOTIVO_SIN_HORAS = 'SIN_HORAS'
 FOLDER_ID = '1rAACqx1K3-LnammeFuGPsbWV7Tqa7MbL'
+MARGEN_HISTORIAL_DIAS = 3
 
+# Columnas de baja cardinalidad que se codifican como categorías: (columna en picking, columna en chequeo)
+COLUMNAS_CATEGORICAS = [
+    ('Empresa', 'empresa'),
+    ('id usuario', 'id usuario'),
+    ('Tipo de pedido', 'Tipo de pedido'),
+    ('Descripcion', 'Descripcion'),
+    ('Nivel de carga', None),
+    ('Zona de Origen', None),
+]
+
+# Conexión HTTP autorizada de cada hilo
+_http_local = threading.local()
+
+def _http_autorizado(credentials):
+    """Retorna la conexión HTTP autorizada del hilo actual, creándola una sola vez por hilo."""
+    conexion = getattr(_http_local, 'conexion', None)
+    if conexion is None or conexion[0] is not credentials:
+        conexion = (credentials, AuthorizedHttp(credentials, http=httplib2.Http(timeout=60)))
+        _http_local.conexion = conexion
+    return conexion[1]
+
+@st.cache_resource
 def get_drive_service():
-    """Configura y retorna el servicio de Google Drive."""
+    """Configura y retorna el servicio compartido de Google Drive.
+    Se construye una vez por proceso con el documento de descubrimiento incluido en
+    googleapiclient, y cada hilo reutiliza su propia conexión HTTP autorizada.
+    """
     credentials = Credentials.from_service_account_info(
         st.secrets["gcp_service_account"],
         scopes=['https://www.googleapis.com/auth/drive.readonly']
     )
-    return build('drive', 'v3', credentials=credentials)
+    
+    def request_builder(http, *args, **kwargs):
+        # httplib2 no es thread-safe: cada solicitud usa la conexión de su hilo
+        return HttpRequest(_http_autorizado(credentials), *args, **kwargs)
+    
+    return build(
+        'drive', 'v3',
+        http=_http_autorizado(credentials),
+        requestBuilder=request_builder,
+        static_discovery=True,
+        cache_discovery=False
+    )
 
-def download_excel_from_drive(service, filename):
-    """Descarga un archivo Excel desde Google Drive."""
-    try:
+def buscar_archivo_drive(service, filename):
+    """Busca un archivo en la carpeta de Drive y retorna sus metadatos de revisión."""
+    results = service.files().list(
+        q=f"name contains '{filename}' and '{FOLDER_ID}' in parents",
+        pageSize=1,
+        fields="files(id, name, modifiedTime, md5Checksum, size)"
+    ).execute()
+    files = results.get('files', [])
+    
+    if not files:
+        raise FileNotFoundError(f"No se encontró el archivo {filename}")
+        
+    return files[0]
+
+def listar_archivos_drive(service, nombre, desde=None, hasta=None):
+    """Lista todos los archivos de la carpeta cuyo nombre contiene `nombre`, recorriendo todas las páginas.
+    desde y hasta (fechas) filtran por fecha de modificación.
+    """
+    consulta = f"name contains '{nombre}' and '{FOLDER_ID}' in parents and trashed = false"
+    if desde is not None:
+        consulta += f" and modifiedTime >= '{desde.isoformat()}T00:00:00'"
+    if hasta is not None:
+        consulta += f" and modifiedTime < '{(hasta + timedelta(days=1)).isoformat()}T00:00:00'"
+    
+    archivos = []
+    page_token = None
+    while True:
         results = service.files().list(
-            q=f"name contains '{filename}' and '{FOLDER_ID}' in parents",
-            pageSize=1,
-            fields="files(id, name)"
+            q=consulta,
+            pageSize=100,
+            pageToken=page_token,
+            fields="nextPageToken, files(id, name, modifiedTime, md5Checksum, size)"
         ).execute()
-        files = results.get('files', [])
-        
-        if not files:
-            raise FileNotFoundError(f"No se encontró el archivo {filename}")
-            
-        file_id = files[0]['id']
-        
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
+        archivos.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    
+    return archivos
+
+def descargar_archivo_drive(service, file_id):
+    """Descarga el contenido de un archivo de Drive en memoria."""
+    request = service.files().get_media(fileId=file_id)
+    file_content = io.BytesIO()
+    downloader = MediaIoBaseDownload(file_content, request)
+    
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
         
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            
-        file_content.seek(0)
-        return file_content
-    except Exception as e:
-        st.error(f"Error al descargar {filename}: {str(e)}")
-        return None
+    file_content.seek(0)
+    return file_content
+
+def cargar_excel_drive(service, filename, esquema=None, tiempos=None):
+    """Carga un Excel de Drive usando el caché Parquet de la revisión actual.
+    Con esquema solo se leen sus columnas; si se entrega el diccionario tiempos,
+    registra la duración de la descarga y de la lectura, y los metadatos de la revisión leída.
+    """
+    inicio = time.perf_counter()
+    archivo = buscar_archivo_drive(service, filename)
+    if tiempos is not None:
+        tiempos['archivo'] = archivo
+    return cargar_archivo_drive(service, archivo, esquema, tiempos, inicio)
+
+def cargar_archivo_drive(service, archivo, esquema=None, tiempos=None, inicio=None):
+    """Carga un archivo de Drive, dados sus metadatos, usando el caché Parquet de su revisión."""
+    if inicio is None:
+        inicio = time.perf_counter()
+    variante = firma_esquema(esquema) if esquema is not None else None
+    
+    # Si la revisión ya fue procesada, leer desde el caché columnar
+    df = leer_cache(archivo, variante)
+    if df is not None:
+        if tiempos is not None:
+            tiempos.update(origen='cache', descarga=0.0, lectura=time.perf_counter() - inicio)
+        return df
+    
+    content = descargar_archivo_drive(service, archivo['id'])
+    fin_descarga = time.perf_counter()
+    df = normalizar_tipos(leer_excel(content, esquema))
+    guardar_cache(archivo, df, variante)
+    if tiempos is not None:
+        tiempos.update(origen='drive', descarga=fin_descarga - inicio,
+                       lectura=time.perf_counter() - fin_descarga)
+    return df
+
+def cargar_archivos_concurrente(archivos, max_workers=2):
+    """Descarga y lee varios Excel de Drive en paralelo.
+    Recibe un diccionario {filename: esquema} y retorna un diccionario {filename: DataFrame}
+    junto con otro con los tiempos por archivo.
+    """
+    service = get_drive_service()
+    tiempos = {filename: {} for filename in archivos}
+    
+    def cargar(filename):
+        return cargar_excel_drive(service, filename, archivos[filename], tiempos[filename])
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {filename: executor.submit(cargar, filename) for filename in archivos}
+        # result() relanza en este hilo cualquier error ocurrido en la carga
+        dataframes = {filename: futuro.result() for filename, futuro in futuros.items()}
+    
+    return dataframes, tiempos
+
+def normalizar_dataframes(df_picking, df_chequeo):
+    """Renombra las columnas clave y limpia los espacios de las empresas."""
+    # Renombrar columnas
+    df_chequeo.rename(columns={
+        'Nombre de grupo de autorizacion': 'empresa',
+        'Id. de usuario de ultima seleccion': 'id usuario'
+    }, inplace=True, errors='ignore')
+    
+    df_picking.rename(columns={
+        'Id. de usuario de ultima seleccion': 'id usuario'
+    }, inplace=True, errors='ignore')
+    
+    # Limpiar espacios
+    if 'Empresa' in df_picking.columns:
+        df_picking['Empresa'] = df_picking['Empresa'].str.strip()
+    if 'empresa' in df_chequeo.columns:
+        df_chequeo['empresa'] = df_chequeo['empresa'].str.strip()
+    
+    return df_picking, df_chequeo
 
 @st.cache_data
 def preparar_dataframes():
     """Carga y preprocesa los dataframes de picking y chequeo."""
     try:
-        service = get_drive_service()
-        
-        picking_content = download_excel_from_drive(service, "Picking.xls")
-        chequeo_content = download_excel_from_drive(service, "Pallet chek.xls")
-        
-        if picking_content is None or chequeo_content is None:
+        inicio = time.perf_counter()
+        dataframes, tiempos = cargar_archivos_concurrente({
+            "Picking.xls": ESQUEMA_PICKING,
+            "Pallet chek.xls": ESQUEMA_CHEQUEO
+        })
+        df_picking = dataframes["Picking.xls"]
+        df_chequeo = dataframes["Pallet chek.xls"]
+        
+        # Reportar tiempos por archivo
+        for filename, t in tiempos.items():
+            print(f"{filename}: origen={t['origen']}, descarga={t['descarga']:.2f}s, lectura={t['lectura']:.2f}s")
+        print(f"Carga total: {time.perf_counter() - inicio:.2f}s")
+        
+        if df_picking is None or df_chequeo is None:
             raise ValueError("No se pudieron descargar los archivos necesarios")
         
-        df_picking = pd.read_excel(picking_content)
-        df_chequeo = pd.read_excel(chequeo_content)
+        df_picking, df_chequeo = normalizar_dataframes(df_picking, df_chequeo)
         
-        # Renombrar columnas
-        df_chequeo.rename(columns={
-            'Nombre de grupo de autorizacion': 'empresa',
-            'Id. de usuario de ultima seleccion': 'id usuario'
-        }, inplace=True, errors='ignore')
+        # Acumular el día en el historial local para consultas por rango
+        guardar_dia(df_picking, df_chequeo, {
+            'picking': tiempos["Picking.xls"].get('archivo'),
+            'chequeo': tiempos["Pallet chek.xls"].get('archivo')
+        })
         
-        df_picking.rename(columns={
-            'Id. de usuario de ultima seleccion': 'id usuario'
-        }, inplace=True, errors='ignore')
-        
-        # Limpiar espacios
-        if 'Empresa' in df_picking.columns:
-            df_picking['Empresa'] = df_picking['Empresa'].str.strip()
-        if 'empresa' in df_chequeo.columns:
-            df_chequeo['empresa'] = df_chequeo['empresa'].str.strip()
-            
         return df_picking, df_chequeo
     except Exception as e:
         st.error(f"Error en preparar_dataframes: {str(e)}")
         return None, None
 
-def aplicar_transformaciones(df_picking, df_chequeo):
-    """Aplica transformaciones específicas a los dataframes."""
+def filtrar_por_fecha_entrega(df, desde, hasta):
+    """Filtra las filas cuya Fecha Entrega está dentro del rango [desde, hasta]."""
+    if 'Fecha Entrega' not in df.columns:
+        return df
+    fechas = pd.to_datetime(df['Fecha Entrega'], errors='coerce', dayfirst=True).dt.date
+    return df[(fechas >= desde) & (fechas <= hasta)]
+
+@st.cache_data
+def cargar_historial(desde, hasta, max_workers=4, dias=None):
+    """Carga todos los exports de picking y chequeo de la carpeta para un rango de fechas de entrega.
+    El picking se filtra por Fecha Entrega y el chequeo se toma de los exports hechos dentro del rango.
+    Con dias ({'picking': días ISO, 'chequeo': días ISO}) solo se traen esos días de cada tipo y los días
+    sin export se registran para no volver a consultarlos. Cada export leído se guarda en el historial local.
+    """
     try:
-        # Transformaciones CAJA PICKEADA
-        mask_imagen = (df_picking['Tipo de pedido'] == '3033-IMAGEN VIÑA') & \
-                     (df_picking['Empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                     (df_picking['id usuario'].isin(PK_IMAGEN))
-        df_picking.loc[mask_imagen, 'Empresa'] = 'IMAGEN'
-        
-        mask_redBull = (df_picking['Empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                       (df_picking['Zona de Origen'].isin(ZONA_TRABAJO))
-        df_picking.loc[mask_redBull, 'Empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
-        
-        # Transformaciones PALLET CHEQUEADO
-        mask_chk_imagen = (df_chequeo['Tipo de pedido'] == '3033-IMAGEN VIÑA') & \
-                         (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                         (df_chequeo['id usuario'].isin(PK_IMAGEN))
-        df_chequeo.loc[mask_chk_imagen, 'empresa'] = 'IMAGEN'
-        
-        if 'zona_de_trabajo' in df_chequeo.columns:
-            mask_chk_redbull = (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                              (df_chequeo['zona_de_trabajo'].isin(ZONA_CHEQUEO))
-            df_chequeo.loc[mask_chk_redbull, 'empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
-        elif 'Zona de trabajo' in df_chequeo.columns:
-            mask_chk_redbull = (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                              (df_chequeo['Zona de trabajo'].isin(ZONA_CHEQUEO))
-            df_chequeo.loc[mask_chk_redbull, 'empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
+        inicio = time.perf_counter()
+        service = get_drive_service()
         
-        # Filtrar empresas
-        df_picking = df_picking[df_picking['Empresa'].isin(ORDER_EMPRESAS)]
-        df_chequeo = df_chequeo[df_chequeo['empresa'].isin(ORDER_EMPRESAS)]
+        # Los exports de picking se listan con holgura, porque un día puede exportarse antes o después,
+        # y luego se filtran por Fecha Entrega. El chequeo no trae fecha de entrega: se toman solo los
+        # exports cuya propia fecha está en el rango, sin holgura
+        margen = timedelta(days=MARGEN_HISTORIAL_DIAS)
+        tareas = []
+        for nombre, tipo, esquema, holgura in (("Picking", 'picking', ESQUEMA_PICKING, margen),
+                                               ("Pallet chek", 'chequeo', ESQUEMA_CHEQUEO, timedelta(0))):
+            if dias is None:
+                archivos = listar_archivos_drive(service, nombre, desde - holgura, hasta + holgura)
+            elif dias[tipo]:
+                primero, ultimo = (date.fromisoformat(dia) for dia in (min(dias[tipo]), max(dias[tipo])))
+                archivos = listar_archivos_drive(service, nombre, primero - holgura, ultimo + holgura)
+                if tipo == 'chequeo':
+                    archivos = [archivo for archivo in archivos if fecha_revision(archivo) in dias[tipo]]
+            else:
+                archivos = []
+            tareas.extend((nombre, tipo, archivo, esquema) for archivo in archivos)
+        
+        # Descargar y leer en paralelo con un número acotado de hilos
+        partes = {"Picking": [], "Pallet chek": []}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = [
+                (nombre, tipo, archivo, executor.submit(cargar_archivo_drive, service, archivo, esquema))
+                for nombre, tipo, archivo, esquema in tareas
+            ]
+            for nombre, tipo, archivo, futuro in futuros:
+                df = futuro.result()
+                df = normalizar_dataframes(df, pd.DataFrame())[0] if tipo == 'picking' else normalizar_dataframes(pd.DataFrame(), df)[1]
+                partes[nombre].append(df)
+                # Acumular el export en el historial local para las próximas consultas
+                try:
+                    guardar_export(tipo, df, archivo)
+                except Exception as e:
+                    print(f"No se pudo guardar {archivo.get('name')} en el historial: {str(e)}")
+        print(f"Historial {desde} a {hasta}: {len(tareas)} archivos en {time.perf_counter() - inicio:.2f}s")
+        
+        if dias is None:
+            if not partes["Picking"] or not partes["Pallet chek"]:
+                raise FileNotFoundError(f"No se encontraron archivos entre {desde} y {hasta}")
+            df_picking = pd.concat(partes["Picking"], ignore_index=True)
+            return filtrar_por_fecha_entrega(df_picking, desde, hasta), pd.concat(partes["Pallet chek"], ignore_index=True)
+        
+        # Solo los días pedidos; los que no aparecen en ningún export no tienen export en Drive
+        df_picking = pd.concat(partes["Picking"], ignore_index=True) if partes["Picking"] else pd.DataFrame()
+        df_chequeo = pd.concat(partes["Pallet chek"], ignore_index=True) if partes["Pallet chek"] else pd.DataFrame()
+        if not df_picking.empty:
+            df_picking = df_picking[fechas_iso(df_picking['Fecha Entrega']).isin(dias['picking']).to_numpy()]
+            con_picking = set(fechas_iso(df_picking['Fecha Entrega']))
+        else:
+            con_picking = set()
+        marcar_dias_sin_export('picking', [dia for dia in dias['picking'] if dia not in con_picking])
+        con_chequeo = {fecha_revision(archivo) for _, tipo, archivo, _ in tareas if tipo == 'chequeo'}
+        marcar_dias_sin_export('chequeo', [dia for dia in dias['chequeo'] if dia not in con_chequeo])
+        return df_picking, df_chequeo
+    except Exception as e:
+        st.error(f"Error en cargar_historial: {str(e)}")
+        return None, None
+
+def cargar_rango(desde, hasta):
+    """Carga un rango de fechas desde el historial local y trae de Drive solo los días que le faltan.
+    Retorna (None, None) si el historial no se puede leer o falla la descarga.
+    """
+    df_picking, df_chequeo, faltantes = cargar_rango_historial(desde, hasta)
+    if faltantes is None:
+        return None, None
+    if faltantes['picking'] or faltantes['chequeo']:
+        drive_picking, drive_chequeo = cargar_historial(desde, hasta, dias=faltantes)
+        if drive_picking is None:
+            return None, None
+        df_picking = pd.concat([df for df in (df_picking, drive_picking) if not df.empty] or [df_picking], ignore_index=True)
+        df_chequeo = pd.concat([df for df in (df_chequeo, drive_chequeo) if not df.empty] or [df_chequeo], ignore_index=True)
+    return df_picking, df_chequeo
+
+def codificar_categorias(df_picking, df_chequeo):
+    """Convierte las columnas de baja cardinalidad a categorías compartidas entre picking y chequeo.
+    Al usar las mismas categorías en ambos dataframes, los filtros, agrupaciones y el merge trabajan sobre códigos enteros.
+    """
+    try:
+        for col_picking, col_chequeo in COLUMNAS_CATEGORICAS:
+            columnas = [(df, col) for df, col in ((df_picking, col_picking), (df_chequeo, col_chequeo))
+                        if col is not None and col in df.columns]
+            if not columnas:
+                continue
+            
+            # Unión de valores de ambos dataframes; las empresas incluyen además las reasignadas
+            categorias = pd.Index([])
+            for df, col in columnas:
+                categorias = categorias.append(pd.Index(df[col].dropna().unique()))
+            if col_picking == 'Empresa':
+                categorias = categorias.append(pd.Index(ORDER_EMPRESAS))
+            # Categorías ordenadas para que las agrupaciones mantengan el orden alfabético
+            categorias = categorias.unique()
+            try:
+                categorias = categorias.sort_values()
+            except TypeError:
+                pass
+            tipo = pd.CategoricalDtype(categorias)
+            
+            for df, col in columnas:
+                df[col] = df[col].astype(tipo)
         
         return df_picking, df_chequeo
+    except Exception as e:
+        st.error(f"Error en codificar_categorias: {str(e)}")
+        return df_picking, df_chequeo
+
+def transformar_registros(df, tipo):
+    """Reasigna las empresas (IMAGEN, RED BULL, ...) según la tabla de reglas y filtra las empresas del reporte
+    en un tipo de registro ('picking' o 'chequeo').
+    """
+    df = aplicar_reglas_empresa(df, tipo)
+    return df[df[COLUMNAS_EMPRESA[tipo]].isin(ORDER_EMPRESAS)]
+
+def aplicar_transformaciones(df_picking, df_chequeo):
+    """Aplica transformaciones específicas a los dataframes."""
+    try:
+        return transformar_registros(df_picking, 'picking'), transformar_registros(df_chequeo, 'chequeo')
     except Exception as e:
         st.error(f"Error en aplicar_transformaciones: {str(e)}")
         return None, None
 
-def procesar_picking(df_picking):
-    """Procesa el dataframe de picking para calcular rendimientos."""
-    try:
-       
- 
+def ejecutar_procesamiento(df_picking, df_chequeo, backend=None, incremental=False, modo_horas=None, devolver_rechazos=False):
+    """Ejecuta aplicar_transformaciones, procesar_picking, procesar_chequeo y unir_datos con el backend configurado.
+    Con incremental=True solo se agregan las filas nuevas del export desde la actualización anterior.
+    Retorna (df_picking, df_chequeo, df_final) con los dataframes ya transformados; con devolver_rechazos=True
+    agrega los grupos rechazados por las reglas de anomalías, evaluados en la misma pasada.
+    """
+    backend = backend or cargar_configuracion()['backend']
+    modo_horas = modo_horas or cargar_configuracion()['modo_horas']
+    
+    # La unión de intervalos no se puede acumular por grupos: el modo 'activo' procesa el export completo
+    if incremental and modo_horas == 'activo':
+        print("Modo de horas 'activo': se omite la actualización incremental")
+        incremental = False
+    
+    if incremental:
+        from .incremental import procesar_incremental
+        return procesar_incremental(df_picking, df_chequeo, modo_horas=modo_horas, devolver_rechazos=devolver_rechazos)
+    
+    if backend == 'polars':
+        try:
+            from .backend_polars import procesar_polars
+            return procesar_polars(df_picking, df_chequeo, modo_horas=modo_horas, devolver_rechazos=devolver_rechazos)
+        except ImportError:
+            st.warning("Polars no está instalado; se usa el backend pandas")
+    
+    df_picking, df_chequeo = aplicar_transformaciones(df_picking, df_chequeo)
+    df_valid, rechazados = procesar_picking(df_picking, modo_horas=modo_horas, devolver_rechazos=True)
+    pallet_grouped = procesar_chequeo(df_chequeo)
+    resultado = (df_picking, df_chequeo, unir_datos(df_valid, pallet_grouped))
+    return resultado + (rechazados,) if devolver_rechazos else resultado
 
+def horas_activas(codigos, n_grupos, inicio, termino):
+    """Horas activas de cada grupo: duración de la unión de sus intervalos [inicio, termino], sin contar pausas.
+    Recibe el código de grupo de cada fila (-1 se ignora) y las horas de cada fila. Los intervalos se ordenan
+    por grupo e inicio y se fusionan con un barrido vectorizado, sin recorrer los grupos en Python.
+    """
+    codigos = np.asarray(codigos, dtype=np.int64)
+    inicio = np.asarray(inicio, dtype='datetime64[ns]').view(np.int64)
+    termino = np.asarray(termino, dtype='datetime64[ns]').view(np.int64)
+    nat = np.iinfo(np.int64).min
+    validas = (codigos >= 0) & (inicio != nat) & (termino != nat) & (termino >= inicio)
+    codigos, inicio, termino = codigos[validas], inicio[validas], termino[validas]
+    if len(codigos) == 0:
+        return np.zeros(n_grupos)
+    
+    orden = np.lexsort((inicio, codigos))
+    codigos, inicio, termino = codigos[orden], inicio[orden], termino[orden]
+    
+    # Un intervalo abre un bloque nuevo si es el primero del grupo o empieza después del mayor término anterior
+    termino_previo = pd.Series(termino).groupby(codigos).cummax().to_numpy()
+    nuevo = np.empty(len(codigos), dtype=bool)
+    nuevo[0] = True
+    nuevo[1:] = (codigos[1:] != codigos[:-1]) | (inicio[1:] > termino_previo[:-1])
+    
+    # Cada bloque va de su primer inicio al mayor término; las horas del grupo son la suma de sus bloques
+    inicios_bloque = np.flatnonzero(nuevo)
+    duracion = np.maximum.reduceat(termino, inicios_bloque) - inicio[inicios_bloque]
+    return np.bincount(codigos[inicios_bloque], weights=duracion, minlength=n_grupos) / 3.6e12
 
-        # Crear una copia profunda para evitar SettingWithCopyWarning
-        df_picking = df_picking.copy()
-        
-        # Procesar fechas antes de dividir el DataFrame
-        df_picking['Hora Inicio'] = pd.to_datetime(df_picking['Hora Inicio'], errors='coerce', dayfirst=True)
-        df_picking['Hora Termino'] = pd.to_datetime(df_picking['Hora Termino'], errors='coerce', dayfirst=True)
-        
-        # Dividir el DataFrame
-        df_imagen = df_picking[(df_picking["Nivel de carga"] != "LPN") & (df_picking['id usuario'].isin(PK_IMAGEN))].copy()
-        df_others = df_picking[(df_picking["Nivel de carga"] != "LPN") & (~df_picking['id usuario'].isin(PK_IMAGEN))].copy()
-
-        # Para usuarios de PK_IMAGEN, solo acumulamos cajas
-        cajas_imagen = df_imagen.groupby(['id usuario', 'Empresa', 'Descripcion', 'Fecha Entrega']).agg(
-            Cajas=('Cajas', 'sum')
-        ).reset_index()
-        cajas_imagen['Rendimiento'] = np.nan
-        cajas_imagen['Hora_Inicio_Min'] = pd.NaT
-        cajas_imagen['Hora_Termino_Max'] = pd.NaT
-        cajas_imagen['Horas Picking'] = np.nan
-        
-        # Corregir fechas de término
-        mask_termino = df_others['Hora Termino'] < df_others['Hora Inicio']
-        df_others.loc[mask_termino, 'Hora Termino'] += pd.Timedelta(days=1)
-        
-        # Agrupar datos con observed=True
-        cajas_others = df_others.groupby(['id usuario', 'Empresa', 'Descripcion', 'Fecha Entrega'], observed=True).agg(
-            Cajas=('Cajas', 'sum'),
-            Hora_Inicio_Min=('Hora Inicio', 'min'),
-            Hora_Termino_Max=('Hora Termino', 'max')
-        ).reset_index()
-
-
-        # Eliminar registros con valores nulos y corregir turnos nocturnos
-        valid_others = cajas_others.dropna(subset=['Hora_Inicio_Min', 'Hora_Termino_Max'])
-        mask_nocturno = valid_others['Hora_Termino_Max'] < valid_others['Hora_Inicio_Min']
-        valid_others.loc[mask_nocturno, 'Hora_Termino_Max'] += pd.Timedelta(days=1)
-        
-        # Filtrar registros inconsistentes
-        valid_others = valid_others[valid_others['Hora_Termino_Max'] >= valid_others['Hora_Inicio_Min']]
-        
-        # Calcular horas picking y rendimiento
-        valid_others['Horas Picking'] = (valid_others['Hora_Termino_Max'] - valid_others['Hora_Inicio_Min']).dt.total_seconds() / 3600
-        valid_others = valid_others[(valid_others['Horas Picking'] > 0) & (valid_others['Horas Picking'] < 12)]
-        valid_others['Rendimiento'] = valid_others['Cajas'] / valid_others['Horas Picking']
-        
-        # Filtrar rendimientos anómalos
-        valid_others = valid_others[valid_others['Rendimiento'] <= 500]
-        valid_others = valid_others[valid_others['Rendimiento'] >= 0]
-        valid_others = valid_others[valid_others['Rendimiento'] <= valid_others['Cajas']]
-        valid_others['Rendimiento'] = valid_others['Rendimiento'].round(2)
+def calcular_rendimiento(cajas_others, reglas=None, devolver_rechazos=False):
+    """Calcula horas de picking y rendimiento por grupo, descartando los grupos inconsistentes o anómalos.
+    Recibe los grupos con Cajas, Hora_Inicio_Min y Hora_Termino_Max; si traen Horas_Activas (modo 'activo'),
+    esas horas reemplazan el rango entre el primer inicio y el último término.
+    Las reglas de anomalías (config/procesamiento.json) se evalúan todas juntas y se filtra una sola vez.
+    Con devolver_rechazos=True retorna (válidos, rechazados con el Motivo de cada grupo).
+    """
+    # Corregir turnos nocturnos
+    inicio = cajas_others['Hora_Inicio_Min']
+    termino = cajas_others['Hora_Termino_Max']
+    termino = termino.mask(termino < inicio, termino + pd.Timedelta(days=1))
+    
+    # Calcular horas picking y rendimiento para todos los grupos
+    if 'Horas_Activas' in cajas_others.columns:
+        horas = cajas_others['Horas_Activas']
+        cajas_others = cajas_others.drop(columns='Horas_Activas')
+    else:
+        horas = (termino - inicio).dt.total_seconds() / 3600
+    grupos = cajas_others.assign(**{
+        'Hora_Termino_Max': termino,
+        'Horas Picking': horas,
+        'Rendimiento': cajas_others['Cajas'] / horas,
+    })
+    
+    # Motivo de rechazo de cada grupo: primero los que no tienen horas, luego la tabla de reglas
+    motivo = evaluar_anomalias(grupos, reglas, [(MOTIVO_SIN_HORAS, (inicio.isna() | termino.isna()).to_numpy())])
+    valido = motivo.isna().to_numpy()
+    
+    valid_others = grupos[valido]
+    valid_others['Rendimiento'] = valid_others['Rendimiento'].round(2)
+    if not devolver_rechazos:
+        return valid_others
+    
+    rechazados = grupos.assign(Motivo=motivo)[~valido][COLUMNAS_RECHAZOS]
+    rechazados['Rendimiento'] = rechazados['Rendimiento'].replace([np.inf, -np.inf], np.nan).round(2)
+    return valid_others, rechazados.reset_index(drop=True)
+
+def calcular_error(pallet_grouped):
+    """Calcula el % de error por grupo a partir de Total_Unidades y Total_Descuento."""
+    pallet_grouped['% Error'] = (pallet_grouped['Total_Descuento'] / pallet_grouped['Total_Unidades']) * 100
+    pallet_grouped['% Error'] = pallet_grouped['% Error'].fillna(0).replace([np.inf, -np.inf], 0)
+    pallet_grouped['% Error'] = pallet_grouped['% Error'].round(2)
+    pallet_grouped['Total_Descuento'] = pallet_grouped['Total_Descuento'].round(0).astype(int)
+    return pallet_grouped
+
+def agrupar_picking(df_picking, modo_horas='rango'):
+    """Agrupa las filas de picking (sin LPN) por usuario, empresa, descripción y fecha.
+    Retorna (cajas_others, cajas_imagen): los usuarios de PK_IMAGEN solo acumulan cajas.
+    Con modo_horas='activo' cajas_others incluye las Horas_Activas de cada grupo.
+    """
+    # Procesar fechas antes de dividir el DataFrame (assign no modifica el DataFrame recibido)
+    df_picking = df_picking.assign(**{
+        'Hora Inicio': parsear_fechas(df_picking['Hora Inicio']),
+        'Hora Termino': parsear_fechas(df_picking['Hora Termino'])
+    })
+    
+    # Dividir el DataFrame; con copy-on-write los filtros no necesitan copia
+    df_imagen = df_picking[(df_picking["Nivel de carga"] != "LPN") & (df_picking['id usuario'].isin(PK_IMAGEN))]
+    df_others = df_picking[(df_picking["Nivel de carga"] != "LPN") & (~df_picking['id usuario'].isin(PK_IMAGEN))]
+
+    # Para usuarios de PK_IMAGEN, solo acumulamos cajas
+    cajas_imagen = df_imagen.groupby(CLAVES_PICKING, observed=True).agg(
+        Cajas=('Cajas', 'sum')
+    ).reset_index()
+    
+    # Corregir fechas de término
+    mask_termino = df_others['Hora Termino'] < df_others['Hora Inicio']
+    df_others.loc[mask_termino, 'Hora Termino'] += pd.Timedelta(days=1)
+    
+    # Agrupar datos con observed=True
+    grupos = df_others.groupby(CLAVES_PICKING, observed=True)
+    cajas_others = grupos.agg(
+        Cajas=('Cajas', 'sum'),
+        Hora_Inicio_Min=('Hora Inicio', 'min'),
+        Hora_Termino_Max=('Hora Termino', 'max')
+    ).reset_index()
+    
+    if modo_horas == 'activo':
+        codigos = grupos.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        cajas_others['Horas_Activas'] = horas_activas(
+            codigos, len(cajas_others), df_others['Hora Inicio'], df_others['Hora Termino'])
+    
+    return cajas_others, cajas_imagen
+
+def unir_picking(valid_others, cajas_imagen):
+    """Une los grupos con rendimiento y los grupos de PK_IMAGEN (sin rendimiento)."""
+    cajas_imagen = cajas_imagen.assign(
+        Rendimiento=np.nan, Hora_Inicio_Min=pd.NaT, Hora_Termino_Max=pd.NaT, **{'Horas Picking': np.nan}
+    )
+    return pd.concat([valid_others, cajas_imagen], ignore_index=True)
+
+def procesar_picking(df_picking, modo_horas=None, devolver_rechazos=False):
+    """Procesa el dataframe de picking para calcular rendimientos.
+    modo_horas ('rango' o 'activo') define cómo se calculan las Horas Picking; por defecto, el de la configuración.
+    Con devolver_rechazos=True retorna (df_valid, grupos rechazados por las reglas de anomalías).
+    """
+    try:
+        cajas_others, cajas_imagen = agrupar_picking(df_picking, modo_horas or cargar_configuracion()['modo_horas'])
+        valid_others, rechazados = calcular_rendimiento(cajas_others, devolver_rechazos=True)
         
         # Unir ambos dataframes
-        df_valid = pd.concat([valid_others, cajas_imagen], ignore_index=True)
-        
-        return df_valid
+        df_valid = unir_picking(valid_others, cajas_imagen)
+        return (df_valid, rechazados) if devolver_rechazos else df_valid
     except Exception as e:
         st.error(f"Error en procesar_picking: {str(e)}")
-        return None
+        return (None, None) if devolver_rechazos else None
 
-def create_grouped_report(df_final):
-    """Genera el reporte agrupado desde un DataFrame."""
-    try:
-        # Crear una copia profunda del DataFrame
-        df = df_final.copy()
-        
-        # Filtrar empresas y ordenar
-        df = df[df['Empresa'].isin(ORDER_EMPRESAS)]
-        df['Empresa'] = pd.Categorical(df['Empresa'], categories=ORDER_EMPRESAS, ordered=True)
-        
-        # Convertir a string antes de agrupar
-        df['USUARIO'] = df['USUARIO'].fillna('').astype(str)
-        
-        # Identificar usuarios PK_IMAGEN
-        pk_imagen_mask = df['USUARIO'].isin(PK_IMAGEN)
-        
-        # Agrupar con observed=True
-        df_subtotales = df.groupby('Empresa', observed=True).agg({
-            'CAJAS': 'sum',
-            'Cjs c/ Error': 'sum'
-        }).reset_index()
-        
-        # [resto del código igual]
-        
-        return df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento
-        
-    except Exception as e:
-        st.error(f"Error en create_grouped_report: {str(e)}")
-        return None, np.nan, np.nan, np.nan
+def completar_columnas_chequeo(df_chequeo):
+    """Agrega las columnas de unidades y descuento si el export usa los nombres alternativos o no las trae."""
+    if 'Cantidad de unidades' not in df_chequeo.columns:
+        if 'Cantidad' in df_chequeo.columns:
+            df_chequeo['Cantidad de unidades'] = df_chequeo['Cantidad']
+        else:
+            df_chequeo['Cantidad de unidades'] = 0
+
+    if 'discqty' not in df_chequeo.columns:
+        if 'Descuento' in df_chequeo.columns:
+            df_chequeo['discqty'] = df_chequeo['Descuento']
+        else:
+            df_chequeo['discqty'] = 0
+    return df_chequeo
+
+def agrupar_chequeo(df_chequeo):
+    """Suma unidades y descuentos del chequeo por usuario y empresa."""
+    df_chequeo = completar_columnas_chequeo(df_chequeo)
+    return df_chequeo.groupby(CLAVES_CHEQUEO, observed=True).agg(
+        Total_Unidades=('Cantidad de unidades', 'sum'),
+        Total_Descuento=('discqty', 'sum')
+    ).reset_index()
 
 def procesar_chequeo(df_chequeo):
     """Procesa el dataframe de chequeo para calcular errores."""
     try:
-        # Verificar y manejar las columnas necesarias
-        if 'Cantidad de unidades' not in df_chequeo.columns:
-            if 'Cantidad' in df_chequeo.columns:
-                df_chequeo['Cantidad de unidades'] = df_chequeo['Cantidad']
-            else:
-                df_chequeo['Cantidad de unidades'] = 0
-
-        if 'discqty' not in df_chequeo.columns:
-            if 'Descuento' in df_chequeo.columns:
-                df_chequeo['discqty'] = df_chequeo['Descuento']
-            else:
-                df_chequeo['discqty'] = 0
-
-        pallet_grouped = df_chequeo.groupby(['id usuario', 'empresa']).agg(
-            Total_Unidades=('Cantidad de unidades', 'sum'),
-            Total_Descuento=('discqty', 'sum')
-        ).reset_index()
+        pallet_grouped = agrupar_chequeo(df_chequeo)
         
         # Calcular porcentaje de error
-        pallet_grouped['% Error'] = (pallet_grouped['Total_Descuento'] / pallet_grouped['Total_Unidades']) * 100
-        pallet_grouped['% Error'] = pallet_grouped['% Error'].fillna(0).replace([np.inf, -np.inf], 0)
-        pallet_grouped['% Error'] = pallet_grouped['% Error'].round(2)
-        pallet_grouped['Total_Descuento'] = pallet_grouped['Total_Descuento'].round(0).astype(int)
-        
-        return pallet_grouped
+        return calcular_error(pallet_grouped)
     except Exception as e:
         st.error(f"Error en procesar_chequeo: {str(e)}")
         return None
@@ -283,107 +601,108 @@ def unir_datos(df_valid, pallet_grouped):
         st.error(f"Error en unir_datos: {str(e)}")
         return None
     
-def create_nivel_carga_summary(df_picking):
-    """Crea el resumen de nivel de carga, incluyendo Sub-LPN."""
-    try:
-        # Asegurarse de que tenemos las columnas necesarias
-        if 'Nivel de carga' not in df_picking.columns or 'Fecha Entrega' not in df_picking.columns or 'Cajas' not in df_picking.columns:
-            raise ValueError("Columnas necesarias no encontradas en df_picking")
-        
-        # No filtramos por nivel de carga, queremos incluir todos los niveles incluyendo "Sub-LPN"
-        pivot_nivel_carga = pd.pivot_table(
-            df_picking,
-            values='Cajas',
-            index='Nivel de carga',
-            columns='Fecha Entrega',
-            aggfunc='sum',
-            fill_value=0,
-            margins=True,
-            margins_name='Total general'
-        )
-        
-        # Ordenar el índice para que "Total general" aparezca al final
-        if 'Total general' in pivot_nivel_carga.index:
-            new_index = [idx for idx in pivot_nivel_carga.index if idx != 'Total general'] + ['Total general']
-            pivot_nivel_carga = pivot_nivel_carga.reindex(new_index)
-        
-        return pivot_nivel_carga
-    except Exception as e:
-        st.error(f"Error en nivel de carga: {str(e)}")
-        print("Error detallado:", str(e))
-        print("Columnas disponibles:", df_picking.columns.tolist() if df_picking is not None else "None")
-        return pd.DataFrame()
+class ReporteAgrupado(NamedTuple):
+    """Resultado de create_grouped_report; se puede desempaquetar como tupla."""
+    reporte: pd.DataFrame
+    min_rendimiento: float
+    mediana_rendimiento: float
+    max_rendimiento: float
+    total_general: pd.DataFrame
+
+# Valores de la columna 'Tipo Fila' del reporte agrupado
+FILA_DETALLE = 'Detalle'
+FILA_SUBTOTAL = 'Subtotal'
+FILA_TOTAL = 'Total'
+TIPO_FILA = pd.CategoricalDtype([FILA_DETALLE, FILA_SUBTOTAL, FILA_TOTAL], ordered=True)
+
+def _porcentaje_error(cjs_error, cajas):
+    """% de error de subtotales y total: 0 cuando no hay cajas."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cajas > 0, cjs_error / cajas * 100, 0.0)
 
 def create_grouped_report(df_final):
-    """Genera el reporte agrupado desde un DataFrame."""
+    """Genera el reporte agrupado: detalle, subtotal por empresa y total general.
+    Los subtotales salen de una sola agrupación por empresa y el total general se obtiene de los subtotales,
+    acumulando suma y cantidad de rendimientos para que el promedio sea el de todas las filas.
+    """
     try:
         # Verificar valores únicos en la columna Empresa
         print("Valores únicos en Empresa antes de procesar:")
         print(df_final['Empresa'].unique())
         
-        # Limpiar y preparar datos
-        df = df_final.copy()
-        
         # Filtrar solo las empresas que están en ORDER_EMPRESAS
-        df = df[df['Empresa'].isin(ORDER_EMPRESAS)]
+        df = df_final[df_final['Empresa'].isin(ORDER_EMPRESAS)]
         
         # Convertir a string antes de concatenar
-        df['USUARIO'] = df['USUARIO'].fillna('').astype(str)
+        df['USUARIO'] = df['USUARIO'].astype(object).fillna('').astype(str)
         
-        # Identificar usuarios PK_IMAGEN
+        # El rendimiento promedio excluye a los usuarios PK_IMAGEN
         pk_imagen_mask = df['USUARIO'].isin(PK_IMAGEN)
-        
-        # Calcular subtotales por empresa ordenados según ORDER_EMPRESAS
-        subtotales = []
-        for empresa in ORDER_EMPRESAS:
-            empresa_df = df[df['Empresa'] == empresa]
-            if not empresa_df.empty:
-                # Calcular subtotal
-                total_cajas = empresa_df['CAJAS'].sum()
-                total_error_cajas = empresa_df['Cjs c/ Error'].sum()
-                
-                # Calcular rendimiento promedio (excluyendo PK_IMAGEN)
-                empresa_no_pk = empresa_df[~empresa_df['USUARIO'].isin(PK_IMAGEN)]
-                rendimiento_promedio = np.nan
-                if not empresa_no_pk.empty and pd.notna(empresa_no_pk['Rendimiento']).any():
-                    rendimiento_promedio = empresa_no_pk['Rendimiento'].mean()
-                
-                subtotales.append({
-                    'Empresa': empresa,
-                    'USUARIO': f'Total {empresa}',
-                    'CAJAS': total_cajas,
-                    'Rendimiento': rendimiento_promedio,
-                    'Cjs c/ Error': total_error_cajas,
-                    '% Error': (total_error_cajas / total_cajas * 100) if total_cajas > 0 else 0
-                })
-        
-        df_subtotales = pd.DataFrame(subtotales)
-        
-        # Calcular total general
-        total_cajas = df['CAJAS'].sum()
-        total_error_cajas = df['Cjs c/ Error'].sum()
-        rendimiento_promedio = df[~pk_imagen_mask]['Rendimiento'].mean() if (~pk_imagen_mask).any() else np.nan
-        
-        df_total_general = pd.DataFrame([{
-            'Empresa': 'TOTAL GENERAL',
-            'USUARIO': 'TOTAL GENERAL',
-            'CAJAS': total_cajas,
-            'Rendimiento': rendimiento_promedio,
-            'Cjs c/ Error': total_error_cajas,
-            '% Error': (total_error_cajas / total_cajas * 100) if total_cajas > 0 else 0
-        }])
-        
-        # Unir todos los dataframes
-        df_final_report = pd.concat([df, df_subtotales, df_total_general], ignore_index=True)
+        rendimiento_valido = df['Rendimiento'].where(~pk_imagen_mask)
+        
+        # Una sola agrupación por empresa, en el orden de ORDER_EMPRESAS
+        if isinstance(df['Empresa'].dtype, pd.CategoricalDtype):
+            empresas = df['Empresa'].cat.set_categories(ORDER_EMPRESAS, ordered=True)
+        else:
+            empresas = pd.Categorical(df['Empresa'], categories=ORDER_EMPRESAS, ordered=True)
+        grupos = pd.DataFrame({
+            'CAJAS': df['CAJAS'],
+            'Cjs c/ Error': df['Cjs c/ Error'],
+            'suma_rendimiento': rendimiento_valido,
+            'n_rendimiento': rendimiento_valido.notna().astype(np.int64)
+        }).groupby(empresas, observed=True).sum()
+        
+        # Total general a partir de los subtotales (una fila más al final de cada columna)
+        filas = {col: np.append(grupos[col].to_numpy(), grupos[col].sum()) for col in grupos.columns}
+        empresas_filas = list(grupos.index.astype(object)) + ['TOTAL GENERAL']
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rendimiento = np.where(filas['n_rendimiento'] > 0, filas['suma_rendimiento'] / filas['n_rendimiento'], np.nan)
+        
+        df_totales = pd.DataFrame({
+            'Empresa': empresas_filas,
+            'USUARIO': [f'Total {empresa}' for empresa in empresas_filas[:-1]] + ['TOTAL GENERAL'],
+            'CAJAS': filas['CAJAS'],
+            'Rendimiento': rendimiento,
+            'Cjs c/ Error': filas['Cjs c/ Error'],
+            '% Error': _porcentaje_error(filas['Cjs c/ Error'], filas['CAJAS']),
+            'Tipo Fila': pd.Categorical([FILA_SUBTOTAL] * len(grupos) + [FILA_TOTAL], dtype=TIPO_FILA)
+        })
+        df_total_general = df_totales.iloc[[-1]].drop(columns=['Tipo Fila']).reset_index(drop=True)
+        
+        # Unir detalle, subtotales y total general
+        df['Tipo Fila'] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), dtype=TIPO_FILA)
+        df_final_report = pd.concat([df, df_totales], ignore_index=True)
         
         # Calcular estadísticas para el coloreado
-        rendimientos_validos = df[~pk_imagen_mask]['Rendimiento'].dropna()
+        rendimientos_validos = rendimiento_valido.dropna()
         min_rendimiento = rendimientos_validos.min() if not rendimientos_validos.empty else np.nan
         mediana_rendimiento = rendimientos_validos.median() if not rendimientos_validos.empty else np.nan
         max_rendimiento = rendimientos_validos.max() if not rendimientos_validos.empty else np.nan
         
-        return df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, df_total_general
+        return ReporteAgrupado(df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, df_total_general)
         
     except Exception as e:
         st.error(f"Error en create_grouped_report: {str(e)}")
-        return None, np.nan, np.nan, np.nan
+        return ReporteAgrupado(None, np.nan, np.nan, np.nan, None)
+
+class Indicadores(NamedTuple):
+    """KPIs del reporte frente a las metas, con el color de cada indicador."""
+    rendimiento_actual: float
+    error: float
+    total_cajas: float
+    color_rendimiento: str
+    color_error: str
+
+def calcular_indicadores(df_final, reporte, meta_rendimiento, meta_error):
+    """Calcula rendimiento promedio, % de error (como fracción) y total de cajas, y su color según las metas."""
+    rendimiento_actual = df_final['Rendimiento'].mean()
+    error = reporte.total_general['% Error'].iloc[0] / 100  # Convertir a decimal
+    total_cajas = df_final['CAJAS'].sum()
+    return Indicadores(
+        rendimiento_actual,
+        error,
+        total_cajas,
+        "red" if rendimiento_actual < meta_rendimiento else "green",
+        "green" if error < meta_error else "red"
+    )
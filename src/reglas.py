@@ -0,0 +1,134 @@
+import operator
+
+import numpy as np
+import pandas as pd
+
+from .config import cargar_configuracion
+
+# Columna de empresa de cada tipo de registro
+COLUMNAS_EMPRESA = {'picking': 'Empresa', 'chequeo': 'empresa'}
+
+_configuracion = cargar_configuracion()
+
+# Constantes del reporte, definidas en config/procesamiento.json
+ORDER_EMPRESAS = list(_configuracion['empresas'])
+PK_IMAGEN = set(_configuracion['usuarios_imagen'])
+REGLAS_EMPRESA = list(_configuracion['reglas_empresa'])
+REGLAS_ANOMALIAS = list(_configuracion['reglas_anomalias'])
+
+# Condiciones de las reglas de anomalías: lo que debe cumplir un grupo válido
+OPERADORES = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+def compilar_reglas(reglas, tipo, columnas, listas=None):
+    """Compila la tabla de reglas de reasignación de empresa para un tipo de registro ('picking' o 'chequeo').
+    Retorna una lista de (empresa destino, empresa origen, {columna: valores}) con las columnas ya resueltas.
+    Las reglas que no definen condiciones para el tipo o cuyas columnas no existen se omiten.
+    """
+    listas = _configuracion if listas is None else listas
+    compiladas = []
+    for regla in reglas:
+        condiciones = regla.get(tipo)
+        if condiciones is None:
+            continue
+
+        resueltas = {}
+        for nombres, valores in condiciones.items():
+            # "a|b": se usa la primera columna alternativa presente en el dataframe
+            columna = next((nombre for nombre in nombres.split('|') if nombre in columnas), None)
+            if columna is None:
+                break
+            # Un texto en lugar de una lista hace referencia a una lista de la configuración
+            resueltas[columna] = set(listas[valores]) if isinstance(valores, str) else set(valores)
+        else:
+            compiladas.append((regla['empresa'], regla.get('si_empresa'), resueltas))
+    return compiladas
+
+def _codigos(serie):
+    """Retorna los códigos enteros de una columna y sus valores distintos (categorías o factorize)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    return pd.factorize(serie)
+
+def aplicar_reglas_empresa(df, tipo, reglas=None):
+    """Reasigna la empresa de cada fila según la tabla de reglas, en una sola pasada.
+    Cada condición se evalúa sobre los valores distintos de su columna y se aplica a las filas por código;
+    la primera regla que calza define la empresa, por lo que agregar reglas no agrega recorridos sobre el texto.
+    """
+    col_empresa = COLUMNAS_EMPRESA[tipo]
+    reglas = REGLAS_EMPRESA if reglas is None else reglas
+    compiladas = compilar_reglas(reglas, tipo, df.columns)
+    if not compiladas or df.empty:
+        return df
+
+    # Códigos de cada columna usada, calculados una sola vez
+    codigos = {}
+    for col in {col_empresa}.union(*(condiciones for _, _, condiciones in compiladas)):
+        codigos[col] = _codigos(df[col])
+
+    def calza(col, valores):
+        # Tabla de búsqueda sobre los valores distintos; el código -1 (nulo) cae en el False agregado al final
+        codigos_col, unicos = codigos[col]
+        tabla = np.append(np.asarray(unicos.isin(list(valores)), dtype=bool), False)
+        return tabla[codigos_col]
+
+    # La empresa destino se expresa como código dentro de los valores de la columna empresa
+    codigos_empresa, empresas = codigos[col_empresa]
+    destinos = [destino for destino, _, _ in compiladas]
+    empresas = empresas.append(pd.Index([d for d in dict.fromkeys(destinos) if d not in empresas]))
+
+    condiciones = []
+    for _, origen, columnas_regla in compiladas:
+        mascara = np.ones(len(df), dtype=bool) if origen is None else calza(col_empresa, [origen])
+        for col, valores in columnas_regla.items():
+            mascara &= calza(col, valores)
+        condiciones.append(mascara)
+
+    nuevos = np.select(condiciones, [empresas.get_loc(destino) for destino in destinos], default=codigos_empresa)
+
+    if isinstance(df[col_empresa].dtype, pd.CategoricalDtype):
+        df[col_empresa] = pd.Categorical.from_codes(nuevos, dtype=pd.CategoricalDtype(empresas))
+    else:
+        valores = np.append(empresas.to_numpy(dtype=object), np.nan)
+        df[col_empresa] = pd.Series(valores[nuevos], index=df.index).astype(df[col_empresa].dtype)
+    return df
+
+def condiciones_anomalias(reglas, columna, valor):
+    """Construye la condición de validez de cada regla de anomalías con las funciones columna(nombre) y valor(número),
+    de modo que la misma tabla de reglas sirve para pandas y Polars. Un texto en "valor" hace referencia a otra columna.
+    Retorna una lista de (motivo, condición).
+    """
+    condiciones = []
+    for regla in reglas:
+        if regla['condicion'] not in OPERADORES:
+            raise ValueError(f"Condición desconocida en la regla {regla['motivo']}: {regla['condicion']}. "
+                             f"Opciones: {', '.join(OPERADORES)}")
+        limite = columna(regla['valor']) if isinstance(regla['valor'], str) else valor(regla['valor'])
+        condiciones.append((regla['motivo'], OPERADORES[regla['condicion']](columna(regla['columna']), limite)))
+    return condiciones
+
+def evaluar_anomalias(df, reglas=None, motivos_previos=()):
+    """Evalúa todas las reglas de anomalías sobre los grupos en una sola pasada.
+    motivos_previos son pares (motivo, máscara de rechazo) que se revisan antes de la tabla de reglas.
+    Retorna el motivo de rechazo de cada fila como categoría (la primera regla que no cumple), nulo si es válida.
+    Los valores nulos no cumplen ninguna regla.
+    """
+    reglas = REGLAS_ANOMALIAS if reglas is None else reglas
+    motivos = [motivo for motivo, _ in motivos_previos]
+    fallas = [np.asarray(mascara, dtype=bool) for _, mascara in motivos_previos]
+    # Las reglas comparan columnas numéricas: se evalúan sobre arreglos de NumPy, donde NaN no cumple ninguna
+    columnas = {}
+    def columna(nombre):
+        if nombre not in columnas:
+            columnas[nombre] = df[nombre].to_numpy(dtype=float, na_value=np.nan)
+        return columnas[nombre]
+    for motivo, condicion in condiciones_anomalias(reglas, columna, lambda numero: numero):
+        motivos.append(motivo)
+        fallas.append(~condicion)
+
+    tipo = pd.CategoricalDtype(list(dict.fromkeys(motivos)))
+    if not fallas:
+        return pd.Series(pd.Categorical.from_codes(np.full(len(df), -1), dtype=tipo), index=df.index)
+
+    # Primera regla que falla en cada fila
+    codigos = np.select(fallas, tipo.categories.get_indexer(motivos), default=-1)
+    return pd.Series(pd.Categorical.from_codes(codigos, dtype=tipo), index=df.index)
@@ -137,7 +137,7 @@ def main():
             df_final = unir_datos(df_valid, pallet_grouped)
             
             # Generar reporte
-            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento = create_grouped_report(df_final)
+            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, _ = create_grouped_report(df_final)
             
             # Obtener la fecha del reporte
             fecha_reporte = df_final_report['Fecha Entrega'].iloc[0] if 'Fecha Entrega' in df_final_report.columns else None
@@ -419,7 +419,7 @@ def main():
                     st.warning("No hay datos disponibles para el resumen de descuentos")
             
             # Generar reporte principal
-            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento = create_grouped_report(df_final)
+            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, _ = create_grouped_report(df_final)
             
             # Formatear y ordenar DataFrame
             df_final_report = format_dataframe(df_final_report)
@@ -475,7 +475,7 @@ def main():
             df_final = unir_datos(df_valid, pallet_grouped)
             
             # Generar reporte principal
-            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento = create_grouped_report(df_final)
+            df_final_report, min_rendimiento, mediana_rendimiento, max_rendimiento, _ = create_grouped_report(df_final)
             
             # Formatear y ordenar DataFrame
             df_final_report = format_dataframe(df_final_report)
@@ -4,6 +4,9 @@ import streamlit as st
 from datetime import datetime
 import io
 import plotly.graph_objects as go
+from .processing import ORDER_EMPRESAS, FILA_DETALLE, FILA_SUBTOTAL, FILA_TOTAL
+from .cache import huella, leer_memo, guardar_memo
+from .config import cargar_configuracion
 
 def crear_indicadores_visuales(df_final):
     """Crea indicadores visuales atractivos para el dashboard."""
@@ -227,15 +230,15 @@ def create_descuento_summary(df_chequeo):
         
         # Verificar si tenemos la columna de consistencia para filtrar
         if 'consistencia' in df_chequeo.columns:
-            df_errores = df_chequeo[df_chequeo['consistencia'] == 'MALO'].copy()
+            df_errores = df_chequeo[df_chequeo['consistencia'] == 'MALO']
             print(f"Filtrando por consistencia == 'MALO': {len(df_errores)} registros")
         else:
             # Si no tenemos consistencia, usar todo el dataframe o filtrar por discqty > 0
             if 'discqty' in df_chequeo.columns:
-                df_errores = df_chequeo[df_chequeo['discqty'] > 0].copy()
+                df_errores = df_chequeo[df_chequeo['discqty'] > 0]
                 print(f"Filtrando por discqty > 0: {len(df_errores)} registros")
             else:
-                df_errores = df_chequeo.copy()
+                df_errores = df_chequeo
                 print(f"Sin filtro, usando todos los registros: {len(df_errores)}")
         
         # Si no tenemos las columnas mínimas necesarias o no hay datos, devolver DataFrame vacío
@@ -260,11 +263,11 @@ def create_descuento_summary(df_chequeo):
         print(f"Agrupando por: {chequeador_col}, {usuario_col}, {carga_col}")
         if 'discqty' in df_errores.columns:
             # Si existe discqty, sumarlo
-            agrupacion = df_errores.groupby([chequeador_col, usuario_col, carga_col])['discqty'].sum().reset_index()
+            agrupacion = df_errores.groupby([chequeador_col, usuario_col, carga_col], observed=True)['discqty'].sum().reset_index()
             agrupacion.rename(columns={'discqty': 'Cantidad'}, inplace=True)
         else:
             # De lo contrario, contar registros
-            agrupacion = df_errores.groupby([chequeador_col, usuario_col, carga_col]).size().reset_index(name='Cantidad')
+            agrupacion = df_errores.groupby([chequeador_col, usuario_col, carga_col], observed=True).size().reset_index(name='Cantidad')
         
         # Ordenar por cantidad de errores (mayor a menor)
         agrupacion = agrupacion.sort_values('Cantidad', ascending=False)
@@ -299,7 +302,8 @@ def create_descuento_summary(df_chequeo):
 def format_dataframe(df):
     """Aplica formato a las columnas del dataframe para su visualización."""
     try:
-        df_formatted = df.copy()
+        # Copia superficial: con copy-on-write los datos se copian solo al reemplazar columnas
+        df_formatted = df.copy(deep=False)
         
         # Formatear columnas numéricas
         if 'CAJAS' in df_formatted.columns:
@@ -320,48 +324,53 @@ def format_dataframe(df):
         st.error(f"Error en format_dataframe: {str(e)}")
         return df
 
-def sort_dataframe(df):
-    """Ordena el dataframe según criterios específicos."""
+def tipo_fila_por_usuario(usuarios):
+    """Deduce el tipo de fila desde la etiqueta de USUARIO, para reportes que no traen la columna 'Tipo Fila'."""
+    usuarios = usuarios.astype(str)
+    return np.select(
+        [usuarios == 'TOTAL GENERAL', usuarios.str.startswith('Total '), ~usuarios.str.startswith('Total')],
+        [FILA_TOTAL, FILA_SUBTOTAL, FILA_DETALLE],
+        default=''
+    )
+
+def posiciones_en_orden(valores, orden):
+    """Retorna la posición de cada valor dentro de la lista orden (-1 si no está).
+    Se buscan solo los valores distintos y el resultado se reparte por código.
+    """
+    if isinstance(valores, list):
+        valores = np.asarray(valores, dtype=object)
+    codigos, unicos = pd.factorize(valores)
+    posiciones = np.append(pd.Index(orden).get_indexer(unicos), -1)
+    return posiciones[codigos]
+
+def sort_dataframe(df, tipo_fila=None):
+    """Ordena el dataframe según criterios específicos.
+    Cada empresa (en el orden de ORDER_EMPRESAS) muestra sus usuarios por CAJAS descendente y luego su subtotal;
+    el total general va al final. El tipo de fila se toma de tipo_fila, de la columna 'Tipo Fila' o,
+    si no existen, de la etiqueta de USUARIO.
+    """
     try:
-        # Orden definido de empresas
-        ORDER_EMPRESAS = ["SAEP", "SINERGY", "J. CATALAN Y CIA. LTDA", "IMAGEN", "J. CATALAN Y CIA. LTDA RED BULL"]
-        
-        # Crear una copia para no modificar el original
-        df_sorted = df.copy()
-        
-        # Crear un DataFrame para cada tipo de fila (datos normales, subtotales, total general)
-        datos_normales = df_sorted[~df_sorted['USUARIO'].astype(str).str.startswith('Total')].copy()
-        subtotales = df_sorted[df_sorted['USUARIO'].astype(str).str.startswith('Total ') & 
-                              (df_sorted['USUARIO'] != 'TOTAL GENERAL')].copy()
-        total_general = df_sorted[df_sorted['USUARIO'] == 'TOTAL GENERAL'].copy()
-        
-        # Para los datos normales, ordenar por empresa (según ORDER_EMPRESAS) y luego por CAJAS descendente dentro de cada empresa
-        result_pieces = []
-        
-        # Para cada empresa en el orden definido
-        for empresa in ORDER_EMPRESAS:
-            # Datos de usuarios normales para esta empresa
-            empresa_data = datos_normales[datos_normales['Empresa'] == empresa].copy()
-            if not empresa_data.empty:
-                # Ordenar por CAJAS descendente
-                empresa_data = empresa_data.sort_values('CAJAS', ascending=False)
-                result_pieces.append(empresa_data)
-                
-                # Encontrar el subtotal correspondiente a esta empresa
-                empresa_subtotal = subtotales[subtotales['Empresa'] == empresa].copy()
-                if not empresa_subtotal.empty:
-                    result_pieces.append(empresa_subtotal)
-        
-        # Agregar el total general al final
-        if not total_general.empty:
-            result_pieces.append(total_general)
-        
-        # Combinar todos los fragmentos en un solo DataFrame
-        if result_pieces:
-            df_final = pd.concat(result_pieces, ignore_index=True)
-            return df_final
-        else:
-            return df_sorted
+        if tipo_fila is None:
+            tipo_fila = df['Tipo Fila'] if 'Tipo Fila' in df.columns else tipo_fila_por_usuario(df['USUARIO'])
+        
+        # Claves de orden: posición de la empresa, tipo de fila y CAJAS descendente (-1 = fuera del orden)
+        rango_tipo = posiciones_en_orden(tipo_fila, [FILA_DETALLE, FILA_SUBTOTAL, FILA_TOTAL])
+        rango_empresa = posiciones_en_orden(df['Empresa'], ORDER_EMPRESAS)
+        rango_empresa[rango_tipo == 2] = len(ORDER_EMPRESAS)
+        cajas = -df['CAJAS'].to_numpy(dtype=float)
+        
+        # Se descartan las empresas fuera de ORDER_EMPRESAS y los subtotales de empresas sin usuarios
+        con_detalle = np.zeros(len(ORDER_EMPRESAS) + 1, dtype=bool)
+        con_detalle[rango_empresa[(rango_tipo == 0) & (rango_empresa >= 0)]] = True
+        conservar = (rango_tipo == 2) | ((rango_empresa >= 0) & (rango_tipo >= 0) &
+                                         ((rango_tipo == 0) | con_detalle[rango_empresa]))
+        
+        # Un solo ordenamiento estable (la última clave es la principal)
+        orden = np.lexsort((cajas, rango_tipo, rango_empresa))
+        orden = orden[conservar[orden]]
+        if len(orden) == 0:
+            return df.copy(deep=False)
+        return df.iloc[orden].reset_index(drop=True)
             
     except Exception as e:
         st.error(f"Error en sort_dataframe: {str(e)}")
@@ -370,10 +379,48 @@ def sort_dataframe(df):
         traceback.print_exc()
         return df
 
-def highlight_cells(df, min_rendimiento, mediana_rendimiento, max_rendimiento):
+# Estilos del reporte detallado
+ESTILO_ROJO = 'background-color: #FF6B6B; color: #ffffff; font-weight: bold'
+ESTILO_VERDE = 'background-color: #98FB98; color: #006400; font-weight: bold'
+ESTILO_TOTAL = 'font-weight: bold; background-color: #E0E0E0'
+
+def colores_rendimiento(valores, min_rendimiento, mediana_rendimiento, max_rendimiento):
+    """Calcula el estilo de cada valor de rendimiento en un solo paso vectorizado.
+    np.digitize ubica cada valor en su tramo (hasta el mínimo, hasta la mediana, sobre la mediana) y el
+    degradado se calcula por canal; los textos CSS se generan una vez por color distinto (tabla de colores).
+    """
+    valores = np.asarray(valores, dtype=float)
+    tramo = np.digitize(valores, [min_rendimiento, mediana_rendimiento], right=True)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_bajo = (valores - min_rendimiento) / (mediana_rendimiento - min_rendimiento)
+        ratio_alto = np.minimum(1, (valores - mediana_rendimiento) / (max_rendimiento - mediana_rendimiento))
+    
+    # Degradado de rojo a amarillo (tramo 1) y de amarillo a verde (tramo 2), truncado como int()
+    nulos = np.isnan(valores)
+    en_bajo = tramo == 1
+    en_alto = (tramo == 2) & ~nulos
+    r = np.where(en_alto, 255 - np.trunc(155 * np.where(en_alto, ratio_alto, 0)), 255).astype(np.int64)
+    g = np.where(en_bajo, 107 + np.trunc(148 * np.where(en_bajo, ratio_bajo, 0)), 255).astype(np.int64)
+    b = np.where(en_bajo, 107 + np.trunc(20 * np.where(en_bajo, ratio_bajo, 0)),
+                 127 - np.trunc(127 * np.where(en_alto, ratio_alto, 0))).astype(np.int64)
+    
+    # Código por color: 0 = sin estilo (nulo), 1 = rojo del mínimo, el resto = rgb del degradado
+    codigo = np.where(tramo == 0, 1, 2 + (r << 16) + (g << 8) + b)
+    codigo[nulos] = 0
+    codigos, unicos = pd.factorize(codigo)
+    tabla = np.array([
+        '' if c == 0 else ESTILO_ROJO if c == 1 else
+        f'background-color: rgb({(c - 2) >> 16},{((c - 2) >> 8) & 255},{(c - 2) & 255}); color: #000000; font-weight: bold'
+        for c in unicos
+    ], dtype=object)
+    return tabla[codigos]
+
+def highlight_cells(df, min_rendimiento, mediana_rendimiento, max_rendimiento, tipo_fila=None):
     """Aplica formato condicional a las celdas del dataframe según criterios específicos.
     Rendimiento: mínimo en rojo, mediana en amarillo, máximo en verde.
     % Error: > 0.05 en rojo, <= 0.05 en verde.
+    Los estilos de todas las celdas se calculan como un arreglo y se aplican con un solo Styler.apply.
     """
     try:
         # Si el dataframe está vacío, devolver sin estilo
@@ -390,66 +437,35 @@ def highlight_cells(df, min_rendimiento, mediana_rendimiento, max_rendimiento):
             
         # Imprimir valores para diagnóstico
         print(f"Valores para formato: min={min_rendimiento}, mediana={mediana_rendimiento}, max={max_rendimiento}")
-            
-        def rendimiento_color(val):
-            """Aplica color al rendimiento según los criterios específicos."""
-            if pd.isna(val):
-                return ''
-                
-            # Para un degradado, calculamos dónde está el valor entre el mínimo y máximo
-            if val <= min_rendimiento:
-                # Rojo para valores cercanos al mínimo
-                return 'background-color: #FF6B6B; color: #ffffff; font-weight: bold'
-            elif val <= mediana_rendimiento:
-                # Amarillo para valores cercanos a la mediana
-                ratio = (val - min_rendimiento) / (mediana_rendimiento - min_rendimiento)
-                # Degradado de rojo a amarillo
-                r = 255
-                g = 107 + int(148 * ratio)  # De 107 a 255
-                b = 107 + int(20 * ratio)   # De 107 a 127
-                return f'background-color: rgb({r},{g},{b}); color: #000000; font-weight: bold'
-            else:
-                # Verde para valores superiores a la mediana
-                ratio = min(1, (val - mediana_rendimiento) / (max_rendimiento - mediana_rendimiento))
-                # Degradado de amarillo a verde
-                r = 255 - int(155 * ratio)  # De 255 a 100
-                g = 255                     # Mantener en 255
-                b = 127 - int(127 * ratio)  # De 127 a 0
-                return f'background-color: rgb({r},{g},{b}); color: #000000; font-weight: bold'
-            
-        def error_color(val):
-            """Aplica color al % de error: rojo si > 0.05, verde si <= 0.05."""
-            if pd.isna(val):
-                return ''
-            elif val > 0.05:
-                return 'background-color: #FF6B6B; color: #ffffff; font-weight: bold'  # Rojo
-            else:
-                return 'background-color: #98FB98; color: #006400; font-weight: bold'  # Verde
-            
-        def usuario_color(val):
-            """Aplica formato a filas de totales basado en USUARIO."""
-            if isinstance(val, str) and ('Total' in val or 'TOTAL' in val):
-                return 'font-weight: bold; background-color: #E0E0E0'
-            return ''
-            
-        # Aplicar formatos
-        styled = df.style
         
-        # Aplicar formato a columnas específicas, evitando filas de totales para rendimiento
+        # Filas de totales: desde el tipo de fila o, si no viene, desde la etiqueta de USUARIO
+        if tipo_fila is not None:
+            es_total = np.asarray(tipo_fila) != FILA_DETALLE
+        elif 'USUARIO' in df.columns:
+            es_total = df['USUARIO'].astype(str).str.contains('Total|TOTAL').to_numpy()
+        else:
+            es_total = np.zeros(len(df), dtype=bool)
+        
+        estilos = np.full(df.shape, '', dtype=object)
+        columnas = list(df.columns)
+        
         if 'Rendimiento' in df.columns:
-            # Crear máscara para excluir filas de totales
-            no_totales = ~df['USUARIO'].astype(str).str.contains('Total|TOTAL')
-            # Usar .applymap con subset para aplicar solo a las celdas deseadas
-            styled = styled.applymap(
-                rendimiento_color, 
-                subset=pd.IndexSlice[no_totales, ['Rendimiento']]
-            )
+            colores = colores_rendimiento(df['Rendimiento'], min_rendimiento, mediana_rendimiento, max_rendimiento)
+            estilos[:, columnas.index('Rendimiento')] = np.where(es_total, '', colores)
             
         if '% Error' in df.columns:
-            styled = styled.applymap(error_color, subset=['% Error'])
+            error = df['% Error'].to_numpy(dtype=float)
+            estilos[:, columnas.index('% Error')] = np.where(
+                np.isnan(error), '', np.where(error > 0.05, ESTILO_ROJO, ESTILO_VERDE)
+            )
             
         if 'USUARIO' in df.columns:
-            styled = styled.applymap(usuario_color, subset=['USUARIO'])
+            estilos[:, columnas.index('USUARIO')] = np.where(es_total, ESTILO_TOTAL, '')
+        
+        estilos = pd.DataFrame(estilos, index=df.index, columns=df.columns)
+        
+        # Aplicar todos los estilos de una vez
+        styled = df.style.apply(lambda _: estilos, axis=None)
             
         # Formatear todas las columnas numéricas - Asegurar que Rendimiento no tiene decimales
         if 'CAJAS' in df.columns:
@@ -468,42 +484,51 @@ def highlight_cells(df, min_rendimiento, mediana_rendimiento, max_rendimiento):
         import traceback
         traceback.print_exc()
         return df.style  # Devolver un estilo básico sin formateo
+
+def paginar(df, filas_por_pagina, pagina):
+    """Retorna las filas de una página (desde 1) del dataframe, para no aplicar estilos a todo el reporte."""
+    inicio = (pagina - 1) * filas_por_pagina
+    return df.iloc[inicio:inicio + filas_por_pagina]
     
 
+# Nombre de la fila y columna de totales del resumen de nivel de carga
+TOTAL_NIVEL_CARGA = 'Total general'
+
 def create_nivel_carga_summary(df_picking):
-    """Crea el resumen de nivel de carga, incluyendo Sub-LPN y LPN."""
+    """Crea el resumen de nivel de carga (cajas por nivel y fecha de entrega), incluyendo Sub-LPN y LPN.
+    Se agrupa una sola vez y los totales se suman sobre la matriz ya agregada, con "Total general" al final.
+    El resultado se guarda en memoria con la huella de las columnas usadas.
+    """
     try:
         # Asegurarse de que tenemos las columnas necesarias
         if 'Nivel de carga' not in df_picking.columns or 'Fecha Entrega' not in df_picking.columns or 'Cajas' not in df_picking.columns:
             raise ValueError("Columnas necesarias no encontradas en df_picking")
         
-        # Crear una copia para evitar modificaciones no deseadas
-        df = df_picking.copy()
-        
         # IMPORTANTE: No filtrar por nivel de carga para incluir todos los niveles (LPN, Sub-LPN, etc.)
-        # Este es un cambio clave: asegurarse de no filtrar ningún nivel de carga
-        
-        # Crear tabla pivote
-        pivot_nivel_carga = pd.pivot_table(
-            df,
-            values='Cajas',
-            index='Nivel de carga',
-            columns='Fecha Entrega',
-            aggfunc='sum',
-            fill_value=0,
-            margins=True,
-            margins_name='Total general'
-        )
-        
-        # Ordenar el índice para que "Total general" aparezca al final
-        if 'Total general' in pivot_nivel_carga.index:
-            new_index = [idx for idx in pivot_nivel_carga.index if idx != 'Total general'] + ['Total general']
-            pivot_nivel_carga = pivot_nivel_carga.reindex(new_index)
+        clave = huella('nivel_carga', df_picking[['Nivel de carga', 'Fecha Entrega', 'Cajas']])
+        pivot_nivel_carga = leer_memo(clave)
+        if pivot_nivel_carga is None:
+            matriz = (
+                df_picking.groupby(['Nivel de carga', 'Fecha Entrega'], observed=True)['Cajas'].sum()
+                .unstack('Fecha Entrega', fill_value=0)
+            )
+            valores = matriz.to_numpy()
+            total_columnas = valores.sum(axis=0)
+            valores = np.vstack([
+                np.column_stack([valores, valores.sum(axis=1)]),
+                np.append(total_columnas, total_columnas.sum())
+            ])
+            pivot_nivel_carga = pd.DataFrame(
+                valores,
+                index=pd.Index(matriz.index.astype('str').tolist() + [TOTAL_NIVEL_CARGA], name='Nivel de carga'),
+                columns=pd.Index(matriz.columns.tolist() + [TOTAL_NIVEL_CARGA], name='Fecha Entrega')
+            )
+            guardar_memo(clave, pivot_nivel_carga)
         
         # Verificar si "LPN" está en el índice
         if 'LPN' not in pivot_nivel_carga.index:
             st.warning("No se encontraron registros con Nivel de carga 'LPN' en los datos")
-            print("Niveles de carga disponibles:", df['Nivel de carga'].unique())
+            print("Niveles de carga disponibles:", df_picking['Nivel de carga'].unique())
         
         return pivot_nivel_carga
     except Exception as e:
@@ -513,297 +538,318 @@ def create_nivel_carga_summary(df_picking):
         print("Niveles de carga únicos:", df_picking['Nivel de carga'].unique() if df_picking is not None and 'Nivel de carga' in df_picking.columns else "None")
         return pd.DataFrame()
     
-def export_to_excel(df_picking, df_chequeo, reporte_principal, nivel_carga, descuento_summary):
-    """Exporta los dataframes a un archivo Excel con formato consistente."""
+# Formato de fechas y horas en las hojas exportadas (el mismo de pandas.to_excel)
+FORMATO_FECHA_EXCEL = 'yyyy-mm-dd hh:mm:ss'
+
+# Filas convertidas a la vez al escribir las hojas de datos
+FILAS_POR_BLOQUE_EXCEL = 10000
+
+# Columnas de las hojas de datos de referencia
+COLUMNAS_DATOS_PICKING = ['id usuario', 'Empresa', 'Fecha Entrega', 'Nivel de carga',
+                          'Hora Inicio', 'Hora Termino', 'Cajas', 'Descripcion']
+COLUMNAS_DATOS_CHEQUEO = ['id usuario', 'empresa', 'Tipo de pedido', 'Codigo de Articulo',
+                          'Descripcion', 'Cantidad de unidades', 'discqty']
+
+# Meta de rendimiento (cajas/hora) usada en el degradado del Excel
+META_RENDIMIENTO = cargar_configuracion()['meta_rendimiento']
+# Meta de % de error (en decimal) usada en el formato condicional del Excel
+META_ERROR = cargar_configuracion()['meta_error']
+
+def columnas_excel(df):
+    """Convierte cada columna en una lista de valores nativos que xlsxwriter escribe directamente.
+    Nulos e infinitos numéricos quedan en 0; los demás nulos quedan en blanco.
+    """
+    columnas = []
+    for col in df.columns:
+        serie = df[col]
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            valores = serie.to_numpy(dtype=float, na_value=np.nan)
+            columnas.append(np.where(np.isfinite(valores), valores, 0).tolist())
+        else:
+            valores = serie.to_numpy(dtype=object, copy=True)
+            valores[pd.isna(valores)] = None
+            columnas.append(valores.tolist())
+    return columnas
+
+def escribir_hoja(workbook, nombre, df, formato_encabezado):
+    """Escribe un dataframe en una hoja nueva fila por fila (compatible con constant_memory).
+    Los valores se convierten por bloques para que la memoria no crezca con el tamaño de la hoja.
+    """
+    worksheet = workbook.add_worksheet(nombre)
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], formato_encabezado)
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE_EXCEL):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE_EXCEL]
+        for fila, valores in enumerate(zip(*columnas_excel(bloque)), start=inicio + 1):
+            worksheet.write_row(fila, 0, valores)
+    return worksheet
+
+def rangos_excel(mascara, col):
+    """Retorna los rangos de Excel ('E2:E9 E11:E20') de las filas consecutivas marcadas de una columna.
+    La fila 0 del dataframe es la fila 2 de la hoja (después del encabezado).
+    """
+    from xlsxwriter.utility import xl_range
+    
+    bordes = np.diff(np.concatenate([[0], mascara.astype(np.int8), [0]]))
+    inicios = np.flatnonzero(bordes == 1)
+    finales = np.flatnonzero(bordes == -1) - 1
+    return ' '.join(xl_range(inicio + 1, col, final + 1, col) for inicio, final in zip(inicios, finales))
+
+def export_to_excel(df_picking, df_chequeo, reporte_principal, nivel_carga, descuento_summary, tipo_fila=None):
+    """Exporta los dataframes a un archivo Excel con formato consistente.
+    Las hojas se escriben por filas en modo constant_memory y los colores del reporte principal son formatos
+    condicionales de Excel, por lo que el tiempo y la memoria no dependen de formatear celda por celda.
+    El archivo se guarda en memoria con la huella de lo exportado: si nada cambió se reutiliza.
+    """
     try:
-        import io
         from io import BytesIO
         import xlsxwriter
         
+        # Seleccionar columnas relevantes de los datos para reducir tamaño
+        if df_picking is not None:
+            df_picking = df_picking[[col for col in df_picking.columns if col in COLUMNAS_DATOS_PICKING]]
+        if df_chequeo is not None:
+            df_chequeo = df_chequeo[[col for col in df_chequeo.columns if col in COLUMNAS_DATOS_CHEQUEO]]
+        
+        # Reutilizar el archivo si ya se generó con los mismos datos
+        clave = huella('excel', reporte_principal, nivel_carga, descuento_summary, df_picking, df_chequeo, tipo_fila)
+        contenido = leer_memo(clave)
+        if contenido is not None:
+            return BytesIO(contenido)
+        
         # Crear un objeto BytesIO para guardar el archivo
         output = BytesIO()
         
-        # Limpiar valores NaN e Infinitos antes de escribir
-        def clean_dataframe(df):
-            if df is None or df.empty:
-                return df
-            df_clean = df.copy()
-            # Reemplazar NaN e Infinitos con valores que Excel pueda manejar
-            for col in df_clean.columns:
-                if df_clean[col].dtype == 'float64' or df_clean[col].dtype == 'int64':
-                    # Reemplazar infinitos con un valor muy grande pero finito
-                    df_clean[col] = df_clean[col].replace([float('inf'), float('-inf')], 0)
-                    # Reemplazar NaN con ceros
-                    df_clean[col] = df_clean[col].fillna(0)
-            return df_clean
-        
-        # Limpiar todos los dataframes
-        reporte_principal_clean = clean_dataframe(reporte_principal)
-        nivel_carga_clean = clean_dataframe(nivel_carga)
-        descuento_summary_clean = clean_dataframe(descuento_summary)
-        df_picking_clean = clean_dataframe(df_picking)
-        df_chequeo_clean = clean_dataframe(df_chequeo)
-        
-        # Crear el archivo Excel con xlsxwriter, sin opciones específicas
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            # Hoja 1: Reporte Principal
-            reporte_principal_clean.to_excel(writer, sheet_name='Reporte Principal', index=False)
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'default_date_format': FORMATO_FECHA_EXCEL
+        })
+        
+        # Definir formatos
+        formats = {
+            'header': workbook.add_format({
+                'bold': True,
+                'bg_color': '#D0E0F3',
+                'border': 1
+            }),
+            'total': workbook.add_format({
+                'bold': True,
+                'bg_color': '#E0E0E0',
+                'border': 1
+            }),
+            'total_number': workbook.add_format({
+                'bold': True,
+                'bg_color': '#E0E0E0',
+                'border': 1,
+                'num_format': '#,##0'
+            }),
+            'total_percent': workbook.add_format({
+                'bold': True,
+                'bg_color': '#E0E0E0',
+                'border': 1,
+                'num_format': '0.00%'
+            }),
+            # Formatos para degradado de rendimiento
+            'rend_min': workbook.add_format({
+                'bg_color': '#FF6B6B',
+                'font_color': '#FFFFFF',
+                'bold': True,
+                'num_format': '#,##0'
+            }),
+            'rend_low': workbook.add_format({
+                'bg_color': '#FFB347',
+                'font_color': '#000000',
+                'bold': True,
+                'num_format': '#,##0'
+            }),
+            'rend_med': workbook.add_format({
+                'bg_color': '#FFFF99',
+                'font_color': '#000000',
+                'bold': True,
+                'num_format': '#,##0'
+            }),
+            'rend_high': workbook.add_format({
+                'bg_color': '#90EE90',
+                'font_color': '#000000',
+                'bold': True,
+                'num_format': '#,##0'
+            }),
+            # Formatos para el % de error
+            'error_good': workbook.add_format({
+                'bg_color': '#98FB98',
+                'font_color': '#006400',
+                'bold': True,
+                'num_format': '0.00%'
+            }),
+            'error_bad': workbook.add_format({
+                'bg_color': '#FF6B6B',
+                'font_color': '#FFFFFF',
+                'bold': True,
+                'num_format': '0.00%'
+            }),
+            'number': workbook.add_format({
+                'num_format': '#,##0'
+            }),
+            'percent': workbook.add_format({
+                'num_format': '0.00%'
+            })
+        }
+        
+        # Hoja 1: Reporte Principal
+        worksheet_principal = workbook.add_worksheet('Reporte Principal')
+        columnas = list(reporte_principal.columns)
+        
+        # Ajustar anchos de columnas y formatos numéricos por columna
+        anchos = [12, 15, 25, 20]  # Primeras columnas; el resto con 12
+        formatos_columna = {'CAJAS': 'number', 'Rendimiento': 'number', '% Error': 'percent'}
+        for col_num, col in enumerate(columnas):
+            ancho = anchos[col_num] if col_num < len(anchos) else 12
+            formato = formats[formatos_columna[col]] if col in formatos_columna else None
+            worksheet_principal.set_column(col_num, col_num, ancho, formato)
+        
+        worksheet_principal.write_row(0, 0, columnas, formats['header'])
+        
+        # Filas de totales: desde el tipo de fila o desde la etiqueta de USUARIO
+        if tipo_fila is None:
+            tipo_fila = tipo_fila_por_usuario(reporte_principal['USUARIO']) if 'USUARIO' in columnas else np.full(len(reporte_principal), FILA_DETALLE)
+        es_total = np.asarray(tipo_fila) != FILA_DETALLE
+        
+        # El % de error se guarda como fracción para usar el formato de porcentaje de Excel
+        valores_principal = reporte_principal
+        if '% Error' in columnas:
+            valores_principal = reporte_principal.assign(**{'% Error': reporte_principal['% Error'] / 100})
+        formatos_total = [formats['total_' + formatos_columna[col]] if col in formatos_columna else formats['total']
+                          for col in columnas]
+        
+        for row_num, (valores, total) in enumerate(zip(zip(*columnas_excel(valores_principal)), es_total), start=1):
+            if total:
+                for col_num, valor in enumerate(valores):
+                    worksheet_principal.write(row_num, col_num, valor, formatos_total[col_num])
+            else:
+                worksheet_principal.write_row(row_num, 0, valores)
+        
+        # Formatos condicionales sobre las filas de detalle
+        try:
+            # Obtener valores de referencia para formato condicional
+            min_rendimiento = 0
+            mediana_rendimiento = 200
+            max_rendimiento = META_RENDIMIENTO
             
-            # Hoja 2: Nivel de Carga
-            if nivel_carga_clean is not None and not nivel_carga_clean.empty:
-                nivel_carga_clean.to_excel(writer, sheet_name='Nivel de Carga')
+            if 'Rendimiento' in columnas:
+                rendimientos = reporte_principal['Rendimiento'].dropna()
+                if not rendimientos.empty:
+                    min_rendimiento = rendimientos.min()
+                    # Usar mediana como punto medio para el degradado
+                    mediana_rendimiento = rendimientos.median()
             
-            # Hoja 3: Descuentos
-            if descuento_summary_clean is not None and not descuento_summary_clean.empty:
-                descuento_summary_clean.to_excel(writer, sheet_name='Descuentos', index=False)
+            detalle = ~es_total
+            if detalle.any() and 'Rendimiento' in columnas:
+                rangos = rangos_excel(detalle, columnas.index('Rendimiento'))
+                limites = [
+                    ('<', min_rendimiento + (mediana_rendimiento - min_rendimiento) * 0.33, 'rend_min'),  # Rojo
+                    ('<', min_rendimiento + (mediana_rendimiento - min_rendimiento) * 0.66, 'rend_low'),  # Naranja
+                    ('<', mediana_rendimiento + (max_rendimiento - mediana_rendimiento) * 0.5, 'rend_med'),  # Amarillo
+                    ('>=', mediana_rendimiento + (max_rendimiento - mediana_rendimiento) * 0.5, 'rend_high'),  # Verde
+                ]
+                for criterio, limite, formato in limites:
+                    worksheet_principal.conditional_format(rangos.split(' ')[0], {
+                        'type': 'cell', 'criteria': criterio, 'value': float(limite),
+                        'format': formats[formato], 'multi_range': rangos, 'stop_if_true': True
+                    })
             
-            # Hoja 4: Datos Picking (para referencia)
-            if df_picking_clean is not None:
-                # Seleccionar columnas relevantes para reducir tamaño
-                cols_picking = [col for col in df_picking_clean.columns if col in [
-                    'id usuario', 'Empresa', 'Fecha Entrega', 'Nivel de carga',
-                    'Hora Inicio', 'Hora Termino', 'Cajas', 'Descripcion'
-                ]]
-                df_picking_clean[cols_picking].to_excel(writer, sheet_name='Datos Picking', index=False)
+            if detalle.any() and '% Error' in columnas:
+                rangos = rangos_excel(detalle, columnas.index('% Error'))
+                for criterio, formato in [('>', 'error_bad'), ('<=', 'error_good')]:
+                    worksheet_principal.conditional_format(rangos.split(' ')[0], {
+                        'type': 'cell', 'criteria': criterio, 'value': META_ERROR,
+                        'format': formats[formato], 'multi_range': rangos, 'stop_if_true': True
+                    })
             
-            # Hoja 5: Datos Chequeo (para referencia)
-            if df_chequeo_clean is not None:
-                # Seleccionar columnas relevantes para reducir tamaño
-                cols_chequeo = [col for col in df_chequeo_clean.columns if col in [
-                    'id usuario', 'empresa', 'Tipo de pedido', 'Codigo de Articulo',
-                    'Descripcion', 'Cantidad de unidades', 'discqty'
-                ]]
-                df_chequeo_clean[cols_chequeo].to_excel(writer, sheet_name='Datos Chequeo', index=False)
-                
-            # Obtener el workbook y worksheets
-            workbook = writer.book
-            worksheet_principal = writer.sheets['Reporte Principal']
+            # Añadir una sección de información sobre la meta
+            row_meta = len(reporte_principal) + 3
             
-            # Definir formatos
-            formats = {
-                'header': workbook.add_format({
-                    'bold': True,
-                    'bg_color': '#D0E0F3',
-                    'border': 1
-                }),
-                'total': workbook.add_format({
-                    'bold': True,
-                    'bg_color': '#E0E0E0',
-                    'border': 1
-                }),
-                # Formatos para degradado de rendimiento
-                'rend_min': workbook.add_format({
-                    'bg_color': '#FF6B6B',
-                    'font_color': '#FFFFFF',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '#,##0'
-                }),
-                'rend_low': workbook.add_format({
-                    'bg_color': '#FFB347',
-                    'font_color': '#000000',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '#,##0'
-                }),
-                'rend_med': workbook.add_format({
-                    'bg_color': '#FFFF99',
-                    'font_color': '#000000',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '#,##0'
-                }),
-                'rend_high': workbook.add_format({
-                    'bg_color': '#90EE90',
-                    'font_color': '#000000',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '#,##0'
-                }),
-                # Formatos para el % de error
-                'error_good': workbook.add_format({
-                    'bg_color': '#98FB98',
-                    'font_color': '#006400',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '0.00%'
-                }),
-                'error_bad': workbook.add_format({
-                    'bg_color': '#FF6B6B',
-                    'font_color': '#FFFFFF',  # Cambiado de 'color' a 'font_color'
-                    'bold': True,
-                    'num_format': '0.00%'
-                }),
-                'number': workbook.add_format({
-                    'num_format': '#,##0'
-                }),
-                'percent': workbook.add_format({
-                    'num_format': '0.00%'
-                })
-            }
+            # Añadir título
+            meta_format = workbook.add_format({
+                'bold': True,
+                'font_size': 14,
+                'align': 'center',
+                'valign': 'vcenter',
+                'font_color': 'blue',
+                'border': 1
+            })
             
-            # Aplicar formato a encabezados
-            for col_num, value in enumerate(reporte_principal_clean.columns.values):
-                worksheet_principal.write(0, col_num, value, formats['header'])
+            # Escribir información de la meta
+            worksheet_principal.merge_range(row_meta, 0, row_meta, 2, "INFORMACIÓN DE METAS", meta_format)
             
-            # Aplicar formato condicional a las celdas del reporte principal
-            usuario_col = None
-            rendimiento_col = None
-            error_col = None
-            cajas_col = None
+            # Formato para datos de meta
+            meta_data_format = workbook.add_format({
+                'bold': True,
+                'align': 'left',
+                'valign': 'vcenter',
+                'font_size': 12
+            })
             
-            # Encontrar índices de columnas
-            for col_num, col_name in enumerate(reporte_principal_clean.columns):
-                if col_name == 'USUARIO':
-                    usuario_col = col_num
-                elif col_name == 'Rendimiento':
-                    rendimiento_col = col_num
-                elif col_name == '% Error':
-                    error_col = col_num
-                elif col_name == 'CAJAS':
-                    cajas_col = col_num
+            # Valor de meta
+            meta_value_format = workbook.add_format({
+                'bold': True,
+                'align': 'center',
+                'valign': 'vcenter',
+                'font_size': 12,
+                'font_color': 'blue',
+                'num_format': '#,##0'
+            })
             
-            # Versión mejorada para aplicar formatos con degradado
-            try:
-                # Obtener valores de referencia para formato condicional
-                min_rendimiento = 0
-                mediana_rendimiento = 200
-                max_rendimiento = 310  # Meta de rendimiento
-                
-                if 'Rendimiento' in reporte_principal_clean.columns:
-                    rendimientos = reporte_principal_clean['Rendimiento'].dropna()
-                    if not rendimientos.empty:
-                        min_rendimiento = rendimientos.min()
-                        # Usar mediana como punto medio para el degradado
-                        mediana_rendimiento = rendimientos.median()
-                
-                for row_num, row in enumerate(reporte_principal_clean.itertuples(index=False), start=1):
-                    # Determinar si es una fila de total
-                    is_total = False
-                    if usuario_col is not None and row_num < len(reporte_principal_clean) + 1:
-                        usuario = str(getattr(row, 'USUARIO', ''))
-                        if 'Total' in usuario or 'TOTAL' in usuario:
-                            is_total = True
-                    
-                    for col_num, value in enumerate(row):
-                        try:
-                            # Usar try para cada celda para evitar errores
-                            if pd.isna(value):
-                                value = 0
-                            
-                            if is_total:
-                                # Formato para totales
-                                worksheet_principal.write(row_num, col_num, value, formats['total'])
-                            
-                            # Formato degradado para rendimiento (solo para filas que no son totales)
-                            elif rendimiento_col is not None and col_num == rendimiento_col and isinstance(value, (int, float)) and not is_total:
-                                # Degradado de rendimiento
-                                if value < min_rendimiento + (mediana_rendimiento - min_rendimiento) * 0.33:
-                                    fmt = formats['rend_min']  # Rojo
-                                elif value < min_rendimiento + (mediana_rendimiento - min_rendimiento) * 0.66:
-                                    fmt = formats['rend_low']  # Naranja
-                                elif value < mediana_rendimiento + (max_rendimiento - mediana_rendimiento) * 0.5:
-                                    fmt = formats['rend_med']  # Amarillo
-                                else:
-                                    fmt = formats['rend_high']  # Verde
-                                
-                                worksheet_principal.write(row_num, col_num, value, fmt)
-                            
-                            # Formato para % Error
-                            elif error_col is not None and col_num == error_col and isinstance(value, (int, float)):
-                                # Formato condicional para % Error
-                                if value > 0.05:
-                                    worksheet_principal.write(row_num, col_num, value/100, formats['error_bad'])
-                                else:
-                                    worksheet_principal.write(row_num, col_num, value/100, formats['error_good'])
-                            
-                            # Formato para CAJAS
-                            elif cajas_col is not None and col_num == cajas_col and isinstance(value, (int, float)):
-                                worksheet_principal.write(row_num, col_num, value, formats['number'])
-                            
-                            else:
-                                # Formato normal
-                                worksheet_principal.write(row_num, col_num, value)
-                                
-                        except Exception as cell_error:
-                            # Si hay error al formatear una celda, escribirla sin formato
-                            try:
-                                worksheet_principal.write(row_num, col_num, str(value))
-                            except:
-                                worksheet_principal.write(row_num, col_num, "Error")
-                            print(f"Error al formatear celda ({row_num}, {col_num}): {str(cell_error)}")
-                
-                # Añadir una sección de información sobre la meta
-                row_meta = len(reporte_principal_clean) + 3
-                
-                # Añadir título
-                meta_format = workbook.add_format({
-                    'bold': True,
-                    'font_size': 14,
-                    'align': 'center',
-                    'valign': 'vcenter',
-                    'font_color': 'blue',
-                    'border': 1
-                })
-                
-                # Escribir información de la meta
-                worksheet_principal.merge_range(row_meta, 0, row_meta, 2, "INFORMACIÓN DE METAS", meta_format)
-                
-                # Formato para datos de meta
-                meta_data_format = workbook.add_format({
-                    'bold': True,
-                    'align': 'left',
-                    'valign': 'vcenter',
-                    'font_size': 12
-                })
-                
-                # Valor de meta
-                meta_value_format = workbook.add_format({
-                    'bold': True,
-                    'align': 'center',
-                    'valign': 'vcenter',
-                    'font_size': 12,
-                    'font_color': 'blue',
-                    'num_format': '#,##0'
-                })
-                
-                # Escribir meta de rendimiento
-                worksheet_principal.write(row_meta + 2, 0, "Meta de Rendimiento:", meta_data_format)
-                worksheet_principal.write(row_meta + 2, 1, 310, meta_value_format)
-                worksheet_principal.write(row_meta + 2, 2, "cajas/hora", meta_data_format)
-                
-                # Escribir meta de error
-                worksheet_principal.write(row_meta + 3, 0, "Meta de % Error:", meta_data_format)
-                worksheet_principal.write(row_meta + 3, 1, 0.0005, workbook.add_format({
-                    'bold': True,
-                    'align': 'center',
-                    'valign': 'vcenter',
-                    'font_size': 12,
-                    'font_color': 'blue',
-                    'num_format': '0.00%'
-                }))
-                worksheet_principal.write(row_meta + 3, 2, "(menor es mejor)", meta_data_format)
-                
-                # Añadir leyenda del formato de colores
-                worksheet_principal.merge_range(row_meta + 5, 0, row_meta + 5, 2, "LEYENDA DE COLORES", meta_format)
-                
-                # Leyenda de rendimiento
-                worksheet_principal.write(row_meta + 7, 0, "Rendimiento Bajo", formats['rend_min'])
-                worksheet_principal.write(row_meta + 8, 0, "Rendimiento Medio-Bajo", formats['rend_low'])
-                worksheet_principal.write(row_meta + 9, 0, "Rendimiento Medio", formats['rend_med'])
-                worksheet_principal.write(row_meta + 10, 0, "Rendimiento Alto", formats['rend_high'])
-                
-                # Leyenda de error
-                worksheet_principal.write(row_meta + 7, 2, "Error Aceptable", formats['error_good'])
-                worksheet_principal.write(row_meta + 8, 2, "Error Elevado", formats['error_bad'])
-                
-            except Exception as format_error:
-                print(f"Error al aplicar formatos: {str(format_error)}")
-                import traceback
-                traceback.print_exc()
-                # Continuar sin aplicar formatos adicionales
+            # Escribir meta de rendimiento
+            worksheet_principal.write(row_meta + 2, 0, "Meta de Rendimiento:", meta_data_format)
+            worksheet_principal.write(row_meta + 2, 1, META_RENDIMIENTO, meta_value_format)
+            worksheet_principal.write(row_meta + 2, 2, "cajas/hora", meta_data_format)
+            
+            # Escribir meta de error
+            worksheet_principal.write(row_meta + 3, 0, "Meta de % Error:", meta_data_format)
+            worksheet_principal.write(row_meta + 3, 1, META_ERROR, workbook.add_format({
+                'bold': True,
+                'align': 'center',
+                'valign': 'vcenter',
+                'font_size': 12,
+                'font_color': 'blue',
+                'num_format': '0.00%'
+            }))
+            worksheet_principal.write(row_meta + 3, 2, "(menor es mejor)", meta_data_format)
+            
+            # Añadir leyenda del formato de colores
+            worksheet_principal.merge_range(row_meta + 5, 0, row_meta + 5, 2, "LEYENDA DE COLORES", meta_format)
+            
+            # Leyenda de rendimiento y de error (en orden de filas, como exige constant_memory)
+            worksheet_principal.write(row_meta + 7, 0, "Rendimiento Bajo", formats['rend_min'])
+            worksheet_principal.write(row_meta + 7, 2, "Error Aceptable", formats['error_good'])
+            worksheet_principal.write(row_meta + 8, 0, "Rendimiento Medio-Bajo", formats['rend_low'])
+            worksheet_principal.write(row_meta + 8, 2, "Error Elevado", formats['error_bad'])
+            worksheet_principal.write(row_meta + 9, 0, "Rendimiento Medio", formats['rend_med'])
+            worksheet_principal.write(row_meta + 10, 0, "Rendimiento Alto", formats['rend_high'])
             
-            # Ajustar anchos de columnas
-            worksheet_principal.set_column('A:A', 12)  # Fecha
-            worksheet_principal.set_column('B:B', 15)  # Usuario
-            worksheet_principal.set_column('C:C', 25)  # Empresa
-            worksheet_principal.set_column('D:D', 20)  # Descripción
-            worksheet_principal.set_column('E:Z', 12)  # Resto de columnas
+        except Exception as format_error:
+            print(f"Error al aplicar formatos: {str(format_error)}")
+            import traceback
+            traceback.print_exc()
+            # Continuar sin aplicar formatos adicionales
+        
+        # Hoja 2: Nivel de Carga
+        if nivel_carga is not None and not nivel_carga.empty:
+            escribir_hoja(workbook, 'Nivel de Carga', nivel_carga.reset_index(), formats['header'])
+        
+        # Hoja 3: Descuentos
+        if descuento_summary is not None and not descuento_summary.empty:
+            escribir_hoja(workbook, 'Descuentos', descuento_summary, formats['header'])
+        
+        # Hoja 4: Datos Picking (para referencia)
+        if df_picking is not None:
+            escribir_hoja(workbook, 'Datos Picking', df_picking, formats['header'])
+        
+        # Hoja 5: Datos Chequeo (para referencia)
+        if df_chequeo is not None:
+            escribir_hoja(workbook, 'Datos Chequeo', df_chequeo, formats['header'])
+        
+        workbook.close()
+        guardar_memo(clave, output.getvalue())
         
         # Posicionar el puntero al inicio del archivo
         output.seek(0)
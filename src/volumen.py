@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from .cache import MemoLRU, huella
+from .fechas import parsear_fechas
+
+# Dimensiones de cada serie de volumen por hora
+COLUMNAS_SERIE = ['id usuario', 'Empresa', 'Nivel de carga']
+COLUMNAS_VOLUMEN = COLUMNAS_SERIE + ['Hora Inicio', 'Hora Termino', 'Cajas']
+
+# Líneas con más horas que esto se consideran inconsistentes (mismo límite que Horas Picking)
+MAX_HORAS_LINEA = 12
+
+# Días calculados que se mantienen en memoria (un mes de consultas por rango)
+MAX_DIAS = 31
+
+HORA_NS = 3600 * 10**9
+
+_memo_dias = MemoLRU(MAX_DIAS)
+
+def repartir_horas(inicio, termino, cajas):
+    """Reparte las cajas de cada línea entre las horas de reloj que abarca, en proporción al tiempo en cada hora.
+    Recibe inicio y término en nanosegundos. Las líneas de duración cero quedan completas en la hora de inicio.
+    Retorna (posición de la línea, hora en nanosegundos, cajas) por cada par línea-hora.
+    """
+    duracion = termino - inicio
+    hora_inicio = inicio // HORA_NS
+    hora_termino = np.where(duracion > 0, (termino - 1) // HORA_NS, hora_inicio)
+    horas_linea = hora_termino - hora_inicio + 1
+
+    # Una fila por cada hora de cada línea: la posición de la hora dentro de la línea sale de un arange global
+    linea = np.repeat(np.arange(len(horas_linea)), horas_linea)
+    desfase = np.arange(len(linea)) - np.repeat(np.cumsum(horas_linea) - horas_linea, horas_linea)
+    hora = (hora_inicio[linea] + desfase) * HORA_NS
+
+    tramo = np.minimum(termino[linea], hora + HORA_NS) - np.maximum(inicio[linea], hora)
+    peso = np.where(duracion[linea] > 0, tramo / np.maximum(duracion[linea], 1), 1.0)
+    return linea, hora, cajas[linea] * peso
+
+def calcular_volumen(df_picking):
+    """Cajas por hora de cada operador, empresa y nivel de carga a partir de las líneas de picking.
+    Usa Hora Inicio y Hora Termino, corrigiendo los términos del día siguiente como procesar_picking.
+    Retorna un DataFrame largo con Hora, las COLUMNAS_SERIE y Cajas, ordenado por serie y hora.
+    """
+    inicio = parsear_fechas(df_picking['Hora Inicio'])
+    termino = parsear_fechas(df_picking['Hora Termino'])
+    termino = termino.mask(termino < inicio, termino + pd.Timedelta(days=1))
+
+    validas = (inicio.notna() & termino.notna() & df_picking['Cajas'].notna()).to_numpy()
+    inicio = inicio.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    termino = termino.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    largas = validas & (termino - inicio >= MAX_HORAS_LINEA * HORA_NS)
+    if largas.any():
+        print(f"Volumen: se omiten {int(largas.sum())} líneas de {MAX_HORAS_LINEA} horas o más")
+    validas = validas & ~largas
+
+    columnas = pd.DataFrame({
+        'Hora': pd.Series(dtype='datetime64[ns]'), **{col: df_picking[col].iloc[:0] for col in COLUMNAS_SERIE},
+        'Cajas': pd.Series(dtype='float64')
+    })
+    if not validas.any():
+        return columnas
+
+    # Código de serie por línea; las cajas se acumulan en una grilla serie x hora con bincount.
+    # Las horas se factorizan: la grilla solo tiene las horas con cajas, aunque una hora errónea quede lejos del resto
+    grupos = df_picking[COLUMNAS_SERIE][validas].groupby(COLUMNAS_SERIE, observed=True, dropna=False)
+    series = grupos.ngroup().to_numpy()
+    claves = grupos.size().index
+
+    linea, hora, cajas = repartir_horas(inicio[validas], termino[validas], df_picking['Cajas'].to_numpy(dtype=float)[validas])
+    horas, indice_hora = np.unique(hora, return_inverse=True)
+    n_horas = len(horas)
+    celda = series[linea] * n_horas + indice_hora
+    grilla = np.bincount(celda, weights=cajas, minlength=len(claves) * n_horas)
+    ocupadas = np.flatnonzero(np.bincount(celda, minlength=len(claves) * n_horas))
+    volumen = claves[ocupadas // n_horas].to_frame(index=False)
+    volumen.insert(0, 'Hora', pd.to_datetime(horas[ocupadas % n_horas]))
+    volumen['Cajas'] = grilla[ocupadas]
+    return volumen[columnas.columns]
+
+def volumen_por_hora(df_picking):
+    """Volumen por hora de todas las fechas de entrega del picking, calculado y guardado en memoria por día:
+    al cambiar o agregar un día solo se recalcula ese día.
+    """
+    if df_picking is None or df_picking.empty:
+        return None
+
+    partes = []
+    for fecha, df_dia in df_picking.groupby('Fecha Entrega', observed=True, sort=True, dropna=False):
+        clave = huella('volumen', fecha, df_dia[COLUMNAS_VOLUMEN])
+        volumen = _memo_dias.leer(clave)
+        if volumen is None:
+            volumen = calcular_volumen(df_dia).assign(**{'Fecha Entrega': fecha})
+            _memo_dias.guardar(clave, volumen)
+        partes.append(volumen)
+    return pd.concat(partes, ignore_index=True)
+
+def horas_continuas(horas):
+    """Horas del eje de las series: las horas con cajas y las horas vacías entre dos horas con cajas separadas
+    por menos de MAX_HORAS_LINEA. Un salto mayor (por ejemplo, una hora errónea lejos del resto) no se rellena,
+    por lo que el eje crece con las horas presentes y no con el rango entre la primera y la última.
+    """
+    horas = np.unique(np.asarray(horas, dtype='datetime64[ns]').view(np.int64))
+    saltos = np.diff(horas) // HORA_NS
+    pasos = np.append(np.where(saltos < MAX_HORAS_LINEA, saltos, 1), 1)
+    inicio = np.repeat(horas, pasos)
+    desfase = np.arange(len(inicio)) - np.repeat(np.cumsum(pasos) - pasos, pasos)
+    return pd.DatetimeIndex(pd.to_datetime(inicio + desfase * HORA_NS), name='Hora')
+
+def serie_por_hora(volumen, dimension):
+    """Tabla de cajas por hora (filas) y valor de la dimensión (columnas), con las horas sin cajas en cero."""
+    if volumen.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='Hora'))
+    tabla = volumen.groupby(['Hora', dimension], observed=True)['Cajas'].sum().unstack(dimension, fill_value=0)
+    return tabla.reindex(horas_continuas(tabla.index), fill_value=0)
@@ -1,8 +1,7 @@
 import streamlit as st
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
 import io
+from src.processing import get_drive_service
 
 # Configuración
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
@@ -28,26 +27,13 @@ def test_drive_connection():
         st.error("❌ No se encontraron los secretos de GCP")
         return
 
-    # Crear credenciales
-    st.write("### Creando credenciales...")
+    # Obtener el servicio compartido (credenciales y conexión reutilizadas entre ejecuciones)
+    st.write("### Obteniendo servicio de Drive...")
     try:
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
-        st.success("✅ Credenciales creadas correctamente")
+        service = get_drive_service()
+        st.success("✅ Servicio de Drive obtenido correctamente")
     except Exception as e:
-        st.error(f"❌ Error al crear credenciales: {str(e)}")
-        st.exception(e)
-        return
-
-    # Construir servicio
-    st.write("### Construyendo servicio de Drive...")
-    try:
-        service = build('drive', 'v3', credentials=credentials)
-        st.success("✅ Servicio de Drive construido correctamente")
-    except Exception as e:
-        st.error(f"❌ Error al construir servicio: {str(e)}")
+        st.error(f"❌ Error al obtener el servicio: {str(e)}")
         st.exception(e)
         return
 
@@ -1,33 +1,36 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import streamlit as st
 
-# Definición de constantes
-PK_IMAGEN = {'SEBIGSEGO', 'CTAPIAV', 'DIENIALPU'}
-ZONA_TRABAJO = {'Zona Trabajo Licores 02', 'Zona Trabajo Modula'}
-ZONA_CHEQUEO = {'ZT-LIC-02', 'ZT-MOD'}
-ORDER_EMPRESAS = ["SAEP", "SINERGY", "J. CATALAN Y CIA. LTDA", "IMAGEN", "J. CATALAN Y CIA. LTDA RED BULL"]
+# Permitir importar el paquete src al ejecutar este script directamente
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.esquema import ESQUEMA_PICKING, ESQUEMA_CHEQUEO, leer_excel
+# Constantes y reglas de reasignación compartidas con la app (config/procesamiento.json)
+from src.reglas import PK_IMAGEN, ORDER_EMPRESAS, aplicar_reglas_empresa
 
 # Rutas de archivos
 picking_file_path = r"C:\Users\JCHACONM\Desktop\CARGA PICKING\Picking.xls"
 check_file_path = r"C:\Users\JCHACONM\Desktop\CARGA PICKING\Pallet chek.xls"
 
-def cargar_excel(ruta_archivo):
-    """Carga un archivo Excel, manejando extensiones .xls y .xlsx automáticamente."""
+def cargar_excel(ruta_archivo, esquema=None):
+    """Carga un archivo Excel, manejando extensiones .xls y .xlsx automáticamente.
+    Si se entrega un esquema, solo se leen sus columnas con los tipos indicados.
+    """
     try:
         extension = ruta_archivo.split('.')[-1].lower()
         engine = 'xlrd' if extension == 'xls' else 'openpyxl'
-        return pd.read_excel(ruta_archivo, sheet_name=0, engine=engine)
+        return leer_excel(ruta_archivo, esquema, sheet_name=0, engine=engine)
     except Exception as e:
         raise ValueError(f"Error al cargar el archivo {ruta_archivo}: {e}")
 
 def preparar_dataframes():
     """Carga y preprocesa los dataframes de picking y chequeo."""
     # Cargar archivos
-    df_picking = cargar_excel(picking_file_path)
-    df_chequeo = cargar_excel(check_file_path)
+    df_picking = cargar_excel(picking_file_path, ESQUEMA_PICKING)
+    df_chequeo = cargar_excel(check_file_path, ESQUEMA_CHEQUEO)
     
     # Renombrar columnas clave
     df_chequeo.rename(columns={
@@ -49,31 +52,9 @@ def preparar_dataframes():
 
 def aplicar_transformaciones(df_picking, df_chequeo):
     """Aplica transformaciones específicas a los dataframes."""
-    # Transformaciones CAJA PICKEADA
-    mask_imagen = (df_picking['Tipo de pedido'] == '3033-IMAGEN VIÑA') & \
-                 (df_picking['Empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                 (df_picking['id usuario'].isin(PK_IMAGEN))
-    df_picking.loc[mask_imagen, 'Empresa'] = 'IMAGEN'
-    
-    mask_redBull = (df_picking['Empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                   (df_picking['Zona de Origen'].isin(ZONA_TRABAJO))
-    df_picking.loc[mask_redBull, 'Empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
-    
-    # Transformaciones PALLET CHEQUEADO
-    mask_chk_imagen = (df_chequeo['Tipo de pedido'] == '3033-IMAGEN VIÑA') & \
-                      (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                      (df_chequeo['id usuario'].isin(PK_IMAGEN))
-    df_chequeo.loc[mask_chk_imagen, 'empresa'] = 'IMAGEN'
-    
-    # Asegurarse de que la columna 'zona_de_trabajo' existe antes de usarla
-    if 'zona_de_trabajo' in df_chequeo.columns:
-        mask_chk_redbull = (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                           (df_chequeo['zona_de_trabajo'].isin(ZONA_CHEQUEO))
-        df_chequeo.loc[mask_chk_redbull, 'empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
-    elif 'Zona de trabajo' in df_chequeo.columns:  # Comprobación alternativa
-        mask_chk_redbull = (df_chequeo['empresa'] == 'J. CATALAN Y CIA. LTDA') & \
-                           (df_chequeo['Zona de trabajo'].isin(ZONA_CHEQUEO))
-        df_chequeo.loc[mask_chk_redbull, 'empresa'] = 'J. CATALAN Y CIA. LTDA RED BULL'
+    # Reasignación de empresas según la tabla de reglas
+    df_picking = aplicar_reglas_empresa(df_picking, 'picking')
+    df_chequeo = aplicar_reglas_empresa(df_chequeo, 'chequeo')
     
     # Filtrar para que solo aparezcan las empresas en ORDER_EMPRESAS
     df_picking = df_picking[df_picking['Empresa'].isin(ORDER_EMPRESAS)]